@@ -1,34 +1,42 @@
-from utils.utils import get_report_summary, gat_daily_cost
-from Models.pydantic_models import OptimizerRequest
-from fastapi import status, Request
-from fastapi.responses import JSONResponse
-from fastapi.templating import Jinja2Templates
+from utils.utils import get_report_summary, REPORTS_DIR
+from utils.cost_explorer import CostExplorer, get_cost_explorer
+from utils.report_query import query_param_filter, query_report, ReportQueryError, RESERVED_PARAMS
+from utils.report_store import read_manifest
+from utils.delta import diff_path
+from utils.history import FindingsHistory, get_findings_history
+from utils.instrumentation import metrics
+from fastapi import status, Request, Query, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi import APIRouter
-from dotenv import load_dotenv
 from logger import logger
+from functools import lru_cache
 from pathlib import Path
-import pandas as pd 
+import asyncio
+import datetime
 import os
 
 
 
-load_dotenv('.env')
 PROFILE = os.getenv('AWS_PROFILE', 'default')
 get_router = APIRouter()
-REPORTS_DIR = Path('reports')
-templates = Jinja2Templates(directory="templates")
+
+
+@lru_cache(maxsize=1)
+def get_templates():
+    # jinja2 is only needed once a page is rendered, not for the JSON endpoints
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory="templates")
 
 
 @get_router.get("/")
 async def root(request: Request):
     try:
         summary = await get_report_summary()
-        reports = [f.name for f in REPORTS_DIR.glob("*.csv")]
-        return templates.TemplateResponse("home.html",
-                                           {"request": request,
-                                            "summary": summary,
-                                            "reports": reports,
-                                            "aws_profile": PROFILE})
+        reports = [f.name for pattern in ("*.csv", "*.csv.gz") for f in REPORTS_DIR.glob(pattern)]
+        return get_templates().TemplateResponse(request, "home.html",
+                                                {"summary": summary,
+                                                 "reports": reports,
+                                                 "aws_profile": PROFILE})
     except Exception as err:
         logger.error(f"❌ Unexpected error in root controller {err}")
         return JSONResponse(content={"Error": "Error in root controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -37,10 +45,17 @@ async def root(request: Request):
 
 
 @get_router.get("/cost")
-async def daily_cost(request: OptimizerRequest):
+async def daily_cost(start: datetime.date | None = None, end: datetime.date | None = None, group_by: str | None = None,
+                     region: str | None = None, explorer: CostExplorer = Depends(get_cost_explorer)):
     try:
-        region = request.region
-        data = await gat_daily_cost(region=region) 
+        end = end or datetime.datetime.now(datetime.timezone.utc).date()
+        start = start or end - datetime.timedelta(days=7)
+        # with group_by=REGION a region narrows the result to that region's rows
+        key = region if group_by and group_by.upper() == 'REGION' else None
+        data = await explorer.get_daily_costs(start=start, end=end, group_by=group_by, key=key)
+        return JSONResponse(content={"data": data}, status_code=status.HTTP_200_OK)
+    except ValueError as err:
+        return JSONResponse(content={"Error": str(err)}, status_code=status.HTTP_400_BAD_REQUEST)
     except Exception as err:
         logger.error(f"❌ Unexpected error in daily_cost controller {err}")
         return JSONResponse(content={"Error": "Error in daily_cost controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -48,29 +63,107 @@ async def daily_cost(request: OptimizerRequest):
 
 
 
+@get_router.get("/history/waste")
+async def waste_history(start: datetime.date | None = None, end: datetime.date | None = None, granularity: str = 'day',
+                        group_by: str = 'checker,region', checker: str | None = None, region: str | None = None,
+                        account: str | None = None, history: FindingsHistory = Depends(get_findings_history)):
+    try:
+        end = end or datetime.datetime.now(datetime.timezone.utc).date() + datetime.timedelta(days=1)
+        start = start or end - datetime.timedelta(days=30)
+        # monthly cost of the findings per period, e.g. ?granularity=week&group_by=checker
+        data = await history.waste(start=start, end=end, granularity=granularity,
+                                   group_by=tuple(f.strip() for f in group_by.split(',') if f.strip()),
+                                   checker=checker, region=region, account=account)
+        return JSONResponse(content={"data": data}, status_code=status.HTTP_200_OK)
+    except ValueError as err:
+        return JSONResponse(content={"Error": str(err)}, status_code=status.HTTP_400_BAD_REQUEST)
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in waste_history controller {err}")
+        return JSONResponse(content={"Error": "Error in waste_history controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+
+
+@get_router.get("/metrics")
+async def get_metrics():
+    try:
+        # Prometheus text exposition format
+        return PlainTextResponse(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in get_metrics controller {err}")
+        return JSONResponse(content={"Error": "Error in get_metrics controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @get_router.get("/all-reports")
 async def all_reports():
     try:
-        reports = [f for f in os.listdir(REPORTS_DIR) if f.endswith(".csv")]
+        reports = [f for f in os.listdir(REPORTS_DIR) if f.endswith((".csv", ".csv.gz"))]
         return JSONResponse(content={"reports": reports}, status_code=status.HTTP_200_OK)
     except Exception as err:
         logger.error(f"❌ Unexpected error in all_reports controller {err}")
         return JSONResponse(content={"Error": "Error in all_reports controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 
+def _report_file(report_name: str) -> str | None:
+    file_path = os.path.realpath(os.path.join(REPORTS_DIR, report_name))
+    # reject anything that resolves outside the reports directory (e.g. "../.env")
+    if os.path.dirname(file_path) != os.path.realpath(REPORTS_DIR) or not os.path.isfile(file_path):
+        return None
+    return file_path
+
+
+@get_router.get("/reports/{report_name}/rows")
+async def get_report_rows(report_name: str, request: Request, offset: int = 0, limit: int = 50, cursor: str | None = None,
+                          columns: str | None = None, sort: str | None = None, filter: list[str] = Query(default=[])):
+    try:
+        file_path = _report_file(report_name)
+        if file_path is None:
+            return JSONResponse(content={"Error": "Report not found"}, status_code=status.HTTP_404_NOT_FOUND)
+        # any other query parameter is a filter, e.g. ?Region=us-east-1 or ?MonthlyCost>20
+        filters = filter + [query_param_filter(key, value) for key, value in request.query_params.items() if key not in RESERVED_PARAMS]
+        page = await asyncio.to_thread(
+            query_report, Path(file_path),
+            offset=offset,
+            limit=limit,
+            cursor=cursor,
+            columns=[c.strip() for c in columns.split(',') if c.strip()] if columns else None,
+            sort=sort,
+            filters=filters,
+        )
+        entry = (await read_manifest()).get(report_name)
+        page['total'] = entry['rows'] if entry and not filters else None
+        return JSONResponse(content=page, status_code=status.HTTP_200_OK)
+    except ReportQueryError as err:
+        return JSONResponse(content={"Error": str(err)}, status_code=status.HTTP_400_BAD_REQUEST)
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in get_report_rows controller {err}")
+        return JSONResponse(content={"Error": "Error in get_report_rows controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@get_router.get("/reports/{report_name}/diff")
+async def get_report_diff(report_name: str):
+    try:
+        file_path = _report_file(report_name)
+        diff_file = diff_path(Path(file_path)) if file_path else None
+        if diff_file is None or not diff_file.is_file():
+            return JSONResponse(content={"Error": "No diff for this report"}, status_code=status.HTTP_404_NOT_FOUND)
+        # added / removed / changed findings since the previous scan of the same checker and region
+        content = await asyncio.to_thread(diff_file.read_text)
+        return Response(content=content, media_type="application/json")
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in get_report_diff controller {err}")
+        return JSONResponse(content={"Error": "Error in get_report_diff controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @get_router.get("/reports/{report_name}")
 async def get_report(report_name: str, request: Request):
     try:
-        file_path = os.path.join(REPORTS_DIR, report_name)
-        if not os.path.isfile(file_path):
+        if _report_file(report_name) is None:
             return JSONResponse(content={"Error": "Report not found"}, status_code=status.HTTP_404_NOT_FOUND)
-        df = pd.read_csv(file_path)
-        html_table = df.to_html(classes='table table-hover table-striped align-middle', index=False)
+        # the page only renders the shell, rows are fetched page by page from /reports/{report_name}/rows
         logger.info(f"get_report controller: ✅ Report {report_name} fetched successfully")
-        return templates.TemplateResponse("rebort_view.html",
-                                           {"request": request,
-                                            "report_name": report_name,
-                                            "table": html_table})
+        return get_templates().TemplateResponse(request, "rebort_view.html",
+                                                {"report_name": report_name})
     except Exception as err:
         logger.error(f"❌ Unexpected error in get_report controller {err}")
         return JSONResponse(content={"Error": "Error in get_report controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
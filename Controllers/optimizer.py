@@ -1,11 +1,15 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from logger import logger
-from Models.pydantic_models import OptimizerRequest, EC2Request
+from Models.pydantic_models import OptimizerRequest, EC2Request, RefreshRequest, AccountsRefreshRequest
 from fastapi.responses import JSONResponse
 from fastapi import status
-from Optimizers.ec2_checker import find_idle_ec2_instances
-from Optimizers.ebs_checker import list_unused_ebs
-from Optimizers.eip_checker import list_unattached_eips
+from Optimizers.runner import CHECKERS, EC2_OPTIONS, resolve_regions, refresh_regions
+from Optimizers.account_runner import ACCOUNT_WORKERS, refresh_accounts
+from utils.accounts import ACCOUNT_ROLE_NAME, CredentialCache, get_credential_cache, list_organization_accounts, parse_accounts
+from utils.client_pool import ClientPool, get_client_pool
+from utils.jobs import Job, JobScheduler, get_job_scheduler
+from utils.rate_limiter import RateLimiterRegistry, get_rate_limiter
+from utils.streaming import STREAM_FORMATS, stream_response
 
 
 
@@ -13,13 +17,20 @@ from Optimizers.eip_checker import list_unattached_eips
 optimizer_router = APIRouter()
 
 
+def _accepted(job: Job, created: bool) -> JSONResponse:
+    message = "Scan started" if created else "Identical scan already in progress"
+    return JSONResponse(content={"Message": message, "job_id": job.id, "status": job.status}, status_code=status.HTTP_202_ACCEPTED)
+
+
 @optimizer_router.post("/ec2")
-async def check_ec2_instances(request: EC2Request):
+async def check_ec2_instances(request: EC2Request, pool: ClientPool = Depends(get_client_pool),
+                              scheduler: JobScheduler = Depends(get_job_scheduler)):
     try:
         region = request.region
-        cpu_threshold = request.cpu_threshold
-        response = await find_idle_ec2_instances(region, cpu_threshold)
-        return response
+        options = request.model_dump(include=set(EC2_OPTIONS))
+        job, created = scheduler.submit('ec2', region, options,
+                                        lambda: CHECKERS['ec2'](region, options, pool, None), feed=True)
+        return _accepted(job, created)
     except Exception as err:
         logger.error(f"❌ Unexpected error in check_ec2_instance controller {err}")
         return JSONResponse(content={"Error": "Error in check_ec2_instance controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -27,36 +38,151 @@ async def check_ec2_instances(request: EC2Request):
 
 
 @optimizer_router.post("/ebs")
-async def check_ebs(request: OptimizerRequest):
+async def check_ebs(request: OptimizerRequest, pool: ClientPool = Depends(get_client_pool),
+                    scheduler: JobScheduler = Depends(get_job_scheduler)):
     try:
         region = request.region
-        response = await list_unused_ebs(region=region)
-        return response
+        job, created = scheduler.submit('ebs', region, {}, lambda: CHECKERS['ebs'](region, {}, pool, None), feed=True)
+        return _accepted(job, created)
     except Exception as err:
         logger.error(f"❌ Unexpected error in check_ebs controller {err}")
         return JSONResponse(content={"Error": "Error in check_ebs controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @optimizer_router.post("/eip")
-async def check_eip(request: OptimizerRequest):
+async def check_eip(request: OptimizerRequest, pool: ClientPool = Depends(get_client_pool),
+                    scheduler: JobScheduler = Depends(get_job_scheduler)):
     try:
         region = request.region
-        response = await list_unattached_eips(region=region)
-        return response
+        job, created = scheduler.submit('eip', region, {}, lambda: CHECKERS['eip'](region, {}, pool, None), feed=True)
+        return _accepted(job, created)
     except Exception as err:
         logger.error(f"❌ Unexpected error in check_eip controller {err}")
         return JSONResponse(content={"Error": "Error in check_eip controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
 
-@optimizer_router.post("/refresh")
-async def refresh_reports(request: EC2Request):
+
+@optimizer_router.post("/snapshot")
+async def check_snapshots(request: OptimizerRequest, pool: ClientPool = Depends(get_client_pool),
+                          scheduler: JobScheduler = Depends(get_job_scheduler)):
     try:
         region = request.region
-        cpu_threshold = request.cpu_threshold
-        await list_unattached_eips(region=region)
-        await list_unused_ebs(region=region)
-        await find_idle_ec2_instances(region=region, cpu_threshold=cpu_threshold) 
-        logger.info("refresh_reports controller: ✅ All reports refreshed successfully")
-        return JSONResponse(content={"Message": "All reports refreshed successfully"}, status_code=status.HTTP_200_OK)
+        job, created = scheduler.submit('snapshot', region, {}, lambda: CHECKERS['snapshot'](region, {}, pool, None), feed=True)
+        return _accepted(job, created)
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in check_snapshots controller {err}")
+        return JSONResponse(content={"Error": "Error in check_snapshots controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@optimizer_router.post("/refresh")
+async def refresh_reports(request: RefreshRequest, pool: ClientPool = Depends(get_client_pool),
+                          scheduler: JobScheduler = Depends(get_job_scheduler)):
+    try:
+        async def run_refresh():
+            regions = await resolve_regions(request.region, request.regions, pool=pool)
+            result = await refresh_regions(
+                regions=regions,
+                ec2_options=request.model_dump(include=set(EC2_OPTIONS)),
+                max_concurrency=request.max_concurrency,
+                region_concurrency=request.region_concurrency,
+                pool=pool,
+            )
+            if result['failed']:
+                logger.error(f"refresh_reports controller: ❌ {result['failed']} checker runs failed")
+                return JSONResponse(content={"Error": f"{result['failed']} checker runs failed", **result}, status_code=status.HTTP_207_MULTI_STATUS)
+            logger.info("refresh_reports controller: ✅ All reports refreshed successfully")
+            return JSONResponse(content={"Message": "All reports refreshed successfully", **result}, status_code=status.HTTP_200_OK)
+
+        params = request.model_dump(exclude={'region'})
+        job, created = scheduler.submit('refresh', request.region, params, run_refresh)
+        return _accepted(job, created)
     except Exception as err:
         logger.error(f"❌ Unexpected error in refresh_reports controller {err}")
-        return JSONResponse(content={"Error": "Error in refresh_reports controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        return JSONResponse(content={"Error": "Error in refresh_reports controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@optimizer_router.post("/accounts/refresh")
+async def refresh_account_reports(request: AccountsRefreshRequest, pool: ClientPool = Depends(get_client_pool),
+                                  credentials: CredentialCache = Depends(get_credential_cache),
+                                  scheduler: JobScheduler = Depends(get_job_scheduler)):
+    try:
+        role_name = request.role_name or ACCOUNT_ROLE_NAME
+        accounts = parse_accounts(request.accounts, role_name) if request.accounts else None
+
+        async def run_refresh():
+            targets = accounts or await list_organization_accounts(role_name, pool=pool)
+            regions = await resolve_regions(request.region, request.regions, pool=pool)
+            result = await refresh_accounts(
+                accounts=targets,
+                regions=regions,
+                ec2_options=request.model_dump(include=set(EC2_OPTIONS)),
+                workers=request.workers or ACCOUNT_WORKERS,
+                max_concurrency=request.max_concurrency,
+                region_concurrency=request.region_concurrency,
+                credentials=credentials,
+            )
+            if result['failed']:
+                logger.error(f"refresh_account_reports controller: ❌ {result['failed']} account scans failed")
+                return JSONResponse(content={"Error": f"{result['failed']} account scans failed", **result}, status_code=status.HTTP_207_MULTI_STATUS)
+            logger.info(f"refresh_account_reports controller: ✅ {len(targets)} accounts refreshed successfully")
+            return JSONResponse(content={"Message": f"{len(targets)} accounts refreshed successfully", **result}, status_code=status.HTTP_200_OK)
+
+        params = request.model_dump(exclude={'region'})
+        job, created = scheduler.submit('accounts_refresh', request.region, params, run_refresh)
+        return _accepted(job, created)
+    except ValueError as err:
+        return JSONResponse(content={"Error": str(err)}, status_code=status.HTTP_400_BAD_REQUEST)
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in refresh_account_reports controller {err}")
+        return JSONResponse(content={"Error": "Error in refresh_account_reports controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@optimizer_router.get("/jobs")
+async def list_jobs(scheduler: JobScheduler = Depends(get_job_scheduler)):
+    try:
+        return JSONResponse(content={"jobs": [job.to_dict() for job in scheduler.list()]}, status_code=status.HTTP_200_OK)
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in list_jobs controller {err}")
+        return JSONResponse(content={"Error": "Error in list_jobs controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@optimizer_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, timings: bool = False, scheduler: JobScheduler = Depends(get_job_scheduler)):
+    try:
+        job = scheduler.get(job_id)
+        if job is None:
+            return JSONResponse(content={"Error": "Job not found"}, status_code=status.HTTP_404_NOT_FOUND)
+        # ?timings=true adds the seconds spent per checker phase (describe, metrics, pricing, report)
+        return JSONResponse(content=job.to_dict(timings=timings), status_code=status.HTTP_200_OK)
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in get_job controller {err}")
+        return JSONResponse(content={"Error": "Error in get_job controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+
+@optimizer_router.get("/rate-limits")
+async def get_rate_limits(limiter: RateLimiterRegistry = Depends(get_rate_limiter)):
+    try:
+        # current rate / in-flight window per service and region, with call, throttle and retry counters
+        return JSONResponse(content={"limits": limiter.stats()}, status_code=status.HTTP_200_OK)
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in get_rate_limits controller {err}")
+        return JSONResponse(content={"Error": "Error in get_rate_limits controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@optimizer_router.get("/{checker}/stream")
+async def stream_scan(checker: str, params: EC2Request = Depends(), format: str = 'sse', pool: ClientPool = Depends(get_client_pool),
+                      scheduler: JobScheduler = Depends(get_job_scheduler)):
+    try:
+        # starts the same job as POST /optimizer/<checker>, or joins the one already running, and follows it:
+        # findings as they are written to the report, a progress event every STREAM_PROGRESS_INTERVAL seconds
+        # and a last 'done' event with the totals; a client going away leaves the job running
+        if checker not in CHECKERS:
+            return JSONResponse(content={"Error": f"Unknown checker {checker}, one of {', '.join(CHECKERS)}"}, status_code=status.HTTP_404_NOT_FOUND)
+        if format not in STREAM_FORMATS:
+            return JSONResponse(content={"Error": f"format must be one of {', '.join(STREAM_FORMATS)}"}, status_code=status.HTTP_400_BAD_REQUEST)
+        region = params.region
+        options = params.model_dump(include=set(EC2_OPTIONS)) if checker == 'ec2' else {}
+        job, _ = scheduler.submit(checker, region, options, lambda: CHECKERS[checker](region, options, pool, None), feed=True)
+        return stream_response(job.subscribe(), format)
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in stream_scan controller {err}")
+        return JSONResponse(content={"Error": "Error in stream_scan controller"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1,8 +1,23 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class OptimizerRequest(BaseModel):
     region: str = "us-east-1"
 
 class EC2Request(OptimizerRequest):
-    cpu_threshold: float = 5.0  # Default CPU threshold percentage
\ No newline at end of file
+    cpu_threshold: float = 5.0  # Default CPU threshold percentage
+    lookback_days: int = Field(default=1, ge=1, le=90)  # days of hourly datapoints, 1 is the last 24h; 7/14/30 catch weekly patterns
+    # share of those hours that must be under cpu_threshold as well, None -> IDLE_HOURS_FRACTION (0, average only)
+    idle_hours_fraction: float | None = Field(default=None, ge=0, le=1)
+    include_network: bool = False  # NetworkIn/Out must also be low to call an instance idle
+    include_disk: bool = False  # EBS/instance store bytes must also be low to call an instance idle
+
+class RefreshRequest(EC2Request):
+    regions: list[str] | None = None  # None -> only `region`, ["all"] -> every enabled region
+    max_concurrency: int = Field(default=8, ge=1)  # checker runs in flight across all regions
+    region_concurrency: int = Field(default=3, ge=1)  # checker runs in flight per region
+
+class AccountsRefreshRequest(RefreshRequest):
+    accounts: list[str] | None = None  # account ids or role ARNs, None -> every active account of the organization
+    role_name: str | None = None  # role assumed in accounts given by id, defaults to ACCOUNT_ROLE_NAME
+    workers: int | None = Field(default=None, ge=1)  # scan processes, defaults to ACCOUNT_WORKERS
@@ -0,0 +1,170 @@
+import asyncio
+import atexit
+import csv
+import gzip
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from logger import bind_log_context, configure_worker_logging, forward_worker_logs, logger
+from Optimizers.runner import CHECKERS, refresh_regions
+from utils.account_scope import account_scope, scoped_dir
+from utils.accounts import Account, CredentialCache, credential_cache
+from utils.client_pool import ClientPool
+from utils.rate_limiter import RateLimiterRegistry
+from utils.report_sink import ReportSink, report_path
+from utils.report_store import REPORTS_DIR
+
+
+ACCOUNT_WORKERS = int(os.getenv('ACCOUNT_WORKERS', os.cpu_count() or 1))  # scan processes, one event loop each
+
+# per worker process: its event loop and one client pool per account, reused by every unit the worker runs
+_worker_loop: asyncio.AbstractEventLoop | None = None
+_worker_pools: dict[str, ClientPool] = {}
+
+
+def _init_worker(log_queue) -> None:
+    global _worker_loop
+    configure_worker_logging(log_queue)
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+    atexit.register(_close_worker)
+
+
+def _close_worker() -> None:
+    for pool in _worker_pools.values():
+        _worker_loop.run_until_complete(pool.close())
+    _worker_pools.clear()
+    _worker_loop.close()
+
+
+def _account_pool(account: Account, credentials: dict | None) -> ClientPool:
+    pool = _worker_pools.get(account.account_id)
+    if pool is None:
+        if account.role_arn:
+            credential_cache.seed(account.role_arn, credentials)
+            pool = ClientPool(credentials=credential_cache.refreshable(account.role_arn), limiter=RateLimiterRegistry())
+        else:
+            pool = ClientPool(limiter=RateLimiterRegistry())
+        _worker_pools[account.account_id] = pool
+    elif account.role_arn:
+        credential_cache.seed(account.role_arn, credentials)  # newer than the ones the worker holds
+    return pool
+
+
+async def _scan_unit(account: Account, region: str, credentials: dict | None, ec2_options: dict,
+                     max_concurrency: int, region_concurrency: int) -> dict:
+    pool = _account_pool(account, credentials)
+    with account_scope(account.account_id), bind_log_context(account=account.account_id):
+        return await refresh_regions([region], ec2_options, max_concurrency=max_concurrency,
+                                     region_concurrency=region_concurrency, pool=pool)
+
+
+def scan_unit(account: Account, region: str, credentials: dict | None, ec2_options: dict,
+              max_concurrency: int, region_concurrency: int) -> dict:
+    # entry point of a worker process: one account x region, run on the worker's own event loop
+    return _worker_loop.run_until_complete(
+        _scan_unit(account, region, credentials, ec2_options, max_concurrency, region_concurrency))
+
+
+def _read_rows(path: Path) -> list[dict]:
+    opener = gzip.open if path.suffix == '.gz' else open
+    with opener(path, 'rt', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def _read_header(path: Path) -> list[str]:
+    opener = gzip.open if path.suffix == '.gz' else open
+    with opener(path, 'rt', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def _account_report(account_id: str, name: str) -> Path:
+    with account_scope(account_id):
+        return scoped_dir(REPORTS_DIR) / name
+
+
+async def consolidate_reports(parts: dict[str, list[tuple[str, str, float]]]) -> dict[str, str]:
+    # merges the reports written by this run's successful units, checker -> [(account id, report name, monthly cost)],
+    # into one top-level report per checker with an account_id column; older or failed units' files are never read
+    consolidated = {}
+    for checker in CHECKERS:
+        checker_parts = [(account_id, _account_report(account_id, name), cost) for account_id, name, cost in parts.get(checker, [])]
+        fieldnames = ['account_id', *await asyncio.to_thread(_read_header, checker_parts[0][1])] if checker_parts else None
+        path = report_path(f"{checker}_report_all_accounts.csv")
+        # the member accounts' scans are already in the history
+        async with ReportSink(path, fieldnames=fieldnames, checker=checker, region='all', history=False) as sink:
+            for account_id, part, _ in checker_parts:
+                rows = await asyncio.to_thread(_read_rows, part)
+                await sink.write_many([{'account_id': account_id, **row} for row in rows])
+            # each part's cost was already totalled when it was written
+            sink.total_cost = sum(cost or 0.0 for _, _, cost in checker_parts)
+        consolidated[checker] = sink.path.name
+    return consolidated
+
+
+async def refresh_accounts(accounts: list[Account], regions: list[str], ec2_options: dict, workers: int = ACCOUNT_WORKERS,
+                           max_concurrency: int = 8, region_concurrency: int = 3,
+                           credentials: CredentialCache = credential_cache) -> dict:
+    started = time.perf_counter()
+    report = {account.account_id: {} for account in accounts}
+    failed = 0
+
+    async def assume(account: Account) -> dict | None:
+        return await credentials.get(account.role_arn) if account.role_arn else None
+
+    assumed = await asyncio.gather(*[assume(account) for account in accounts], return_exceptions=True)
+    units, failed_units = [], []
+    for account, creds in zip(accounts, assumed):
+        if isinstance(creds, Exception):
+            failed += 1
+            report[account.account_id] = {'status': 'error', 'detail': f"AssumeRole failed: {creds}"}
+            failed_units += [{'account': account.account_id, 'region': region, 'checker': checker, 'detail': f"AssumeRole failed: {creds}"}
+                             for region in regions for checker in CHECKERS]
+            continue
+        units += [(account, region, creds) for region in regions]
+
+    loop = asyncio.get_running_loop()
+    workers = max(1, min(workers, len(units)))
+    # spawn, not fork: the parent's event loop, clients and logging thread must not leak into the workers
+    context = multiprocessing.get_context('spawn')
+    log_queue = context.Queue()
+    with forward_worker_logs(log_queue):
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(log_queue,))
+        try:
+            results = await asyncio.gather(*[
+                loop.run_in_executor(executor, scan_unit, account, region, creds, ec2_options, max_concurrency, region_concurrency)
+                for account, region, creds in units
+            ], return_exceptions=True)
+        finally:
+            # waiting for the workers to exit must not block the server's event loop
+            await asyncio.to_thread(executor.shutdown)
+
+    parts = {checker: [] for checker in CHECKERS}
+    for (account, region, _), result in zip(units, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error in account_runner.refresh_accounts() Method: ❌ {account.account_id} {region} failed: {result}")
+            report[account.account_id][region] = {'status': 'error', 'detail': str(result)}
+            failed += 1
+            failed_units += [{'account': account.account_id, 'region': region, 'checker': checker, 'detail': str(result)}
+                             for checker in CHECKERS]
+            continue
+        report[account.account_id][region] = result['regions'][region]
+        failed += result['failed']
+        for checker, outcome in result['regions'][region].items():
+            if outcome['status'] == 'ok':
+                parts[checker].append((account.account_id, outcome['report'], outcome.get('monthly_cost')))
+            else:
+                failed_units.append({'account': account.account_id, 'region': region, 'checker': checker, 'detail': outcome['detail']})
+    # only this run's successful units are merged, the failed ones are listed next to the reports
+    consolidated = await consolidate_reports(parts)
+    logger.info(f"account_runner.refresh_accounts() Method: ✅ Scanned {len(accounts)} accounts x {len(regions)} regions "
+                f"in {time.perf_counter() - started:.2f}s with {workers} workers")
+    return {
+        'accounts': report,
+        'reports': consolidated,
+        'failed_units': failed_units,
+        'seconds': round(time.perf_counter() - started, 3),
+        'failed': failed,
+    }
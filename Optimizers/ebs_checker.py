@@ -1,16 +1,16 @@
-import aioboto3
 from botocore.exceptions import ClientError
-from utils.utils import save_to_csv, get_aws_resource_price
-from dotenv import load_dotenv
+from utils.report_sink import ReportSink, report_path
+from utils.price_cache import get_cached_price
+from utils.offline_pricing import AmbiguousPriceError
+from utils.client_pool import ClientPool, client_pool
+from utils.inventory import RegionInventory, VolumeRecord, load_inventory
+from utils.delta import DeltaScan, fingerprint
+from utils.jobs import phase, report_progress
+from utils.streaming import Progress, ScanEvents, drain
 from fastapi import status
 from fastapi.responses import JSONResponse
 from logger import logger
-import asyncio
 import datetime
-import os 
-
-load_dotenv('.env')
-PROFILE = os.getenv('AWS_PROFILE')
 
 
 EBS_PRICING_TYPE_MAP = {
@@ -24,40 +24,70 @@ EBS_PRICING_TYPE_MAP = {
 }
 
 
+EBS_REPORT_FIELDS = ['VolumeId', 'Size(GB)', 'VolumeType', 'Region', 'MonthlyCost($)']
+
+
+async def _evaluate_volume(vol: VolumeRecord, region: str) -> dict | None:
+    if vol.attached:
+        return None
+    try:
+        with phase('ebs', 'pricing'):
+            price = await get_cached_price(
+                service_code='AmazonEC2',
+                filters = [
+                    {"Field": "productFamily", "Value": "Storage"},
+                    {"Field": "volumeType", "Value": EBS_PRICING_TYPE_MAP.get(vol.type, vol.type)},
+                    {"Field": "volumeApiName", "Value": vol.type},
+                ],
+                region = region
+            )
+    except AmbiguousPriceError as err:
+        # only this volume goes unpriced, the rest of the scan carries on
+        logger.error(f"Error in ebs_checker._evaluate_volume() Method: ❌ {vol.id} left unpriced: {err}")
+        price = None
+    logger.info(f"Volume price is {price}")
+    return {
+        'VolumeId': vol.id,
+        'Size(GB)': vol.size,
+        'VolumeType': vol.type,
+        'Region': region,
+        'MonthlyCost($)': f"${round(price * vol.size, 4)}" if price is not None else 'unknown'
+    }
+
+
+async def scan_unused_ebs(region: str, pool: ClientPool = client_pool, inventory: RegionInventory | None = None) -> ScanEvents:
+    # yields every finding as soon as it is written to the report, see utils/streaming.py
+    logger.info(f"############ Executing unused EBS checker at time {datetime.datetime.now()} ############")
+    if inventory is None:
+        with phase('ebs', 'describe'):
+            inventory = await load_inventory(region, pool, kinds=('volumes',))
+    path = report_path(f"unused_ebs_{region}.csv")
+    progress = Progress(len(inventory.volumes))
+    async with DeltaScan('ebs', region, path) as delta, \
+            ReportSink(path, fieldnames=EBS_REPORT_FIELDS, checker='ebs', region=region, cost_field='MonthlyCost($)') as sink:
+        for vol in inventory.volumes.values():
+            await report_progress()
+            vol_fingerprint = fingerprint(vol.size, vol.type, vol.attached)
+            unchanged, finding = delta.lookup(vol.id, vol_fingerprint)
+            if not unchanged:
+                finding = await _evaluate_volume(vol, region)
+                delta.record(vol.id, vol_fingerprint, finding)
+            if finding:
+                with phase('ebs', 'report'):
+                    await sink.write(finding)
+                yield 'finding', finding
+            if event := progress.advance():
+                yield event
+    logger.info(f"✅ Unused EBS report generated and saved to {path}")
+    yield 'done', {'Message': f"Unused EBS report for region {region} generated.", 'report': sink.path.name,
+                   'rows': sink.rows, 'monthly_cost': round(sink.total_cost, 2)}
+
 
-async def list_unused_ebs(region: str) -> bool:
+async def list_unused_ebs(region: str, pool: ClientPool = client_pool, inventory: RegionInventory | None = None) -> bool:
     try:
-        logger.info(f"############ Executing unused EBS checker at time {datetime.datetime.now()} ############")
-        report = []
-        async with aioboto3.Session(profile_name=PROFILE).client('ec2', region_name=region) as ec2:
-            paginator = ec2.get_paginator('describe_volumes')
-            async for page in paginator.paginate():
-                for vol in page.get('Volumes', []):
-                    if not vol.get('Attachments'):
-                        vol_id = vol['VolumeId']
-                        size = vol['Size']
-                        vol_type = vol['VolumeType']
-                        price = await asyncio.to_thread(get_aws_resource_price,
-                            service_code='AmazonEC2',
-                            filters = [
-                                {"Field": "productFamily", "Value": "Storage"},
-                                {"Field": "volumeType", "Value": EBS_PRICING_TYPE_MAP.get(vol_type, vol_type)},
-                                {"Field": "volumeApiName", "Value": vol_type},
-                            ],
-                            region = region
-                        )
-                        logger.info(f"Volume price is {price}")
-                        monthly_cost = round(price * size , 4)
-                        report.append({
-                            'VolumeId': vol_id,
-                            'Size(GB)': size,
-                            'VolumeType': vol_type,
-                            'Region': region,
-                            'MonthlyCost($)': f"${monthly_cost}"
-                        })
-                        await save_to_csv(data=report, fil_path=f"/mnt/BA82FDFB82FDBC47/Python_Devops/boto3/aws-cost-optimizer/reports/unused_ebs_{region}.csv")
-        logger.info(f"✅ Unused EBS report generated and saved to reports/unused_ebs.csv")
-        return JSONResponse(content={"Message": f"Unused EBS report for region {region} generated."}, status_code=status.HTTP_200_OK)
+        summary = await drain(scan_unused_ebs(region, pool, inventory))
+        return JSONResponse(content={"Message": f"Unused EBS report for region {region} generated.", "Report": summary["report"],
+                                     "MonthlyCost": summary["monthly_cost"]}, status_code=status.HTTP_200_OK)
     except ClientError as err:
         logger.error(f"❌ AWS ClientError: {err}")
         return JSONResponse(content={"Error": f"AWS ClientError: {err}"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1,30 +1,25 @@
-import aioboto3
-import os 
-import asyncio
 from botocore.exceptions import ClientError
 from logger import logger
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from utils.utils import get_aws_resource_price, save_to_csv
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from utils.report_sink import ReportSink, report_path
+from utils.price_cache import get_cached_price
+from utils.offline_pricing import AmbiguousPriceError
+from utils.regions import REGION_NAME_MAP
+from utils.metric_cache import metric_cache
+from utils.fleet_analytics import (ACTIVE, DISK_METRICS, IDLE_HOURS_FRACTION, NETWORK_METRICS, NO_DATA, RIGHTSIZE,
+                                   RIGHTSIZE_P95_THRESHOLD, classify, combine, utilization_stats)
+from utils.client_pool import ClientPool, client_pool
+from utils.inventory import RegionInventory, load_inventory
+from utils.jobs import phase, report_progress
+from utils.delta import DeltaScan
+from utils.streaming import Progress, ScanEvents, drain
 from fastapi import status
 from fastapi.responses import JSONResponse
 
 
-load_dotenv('.env')
-
-REGION_NAME_MAP = {
-    "us-east-1": "US East (N. Virginia)",
-    "us-east-2": "US East (Ohio)",
-    "us-west-1": "US West (N. California)",
-    "us-west-2": "US West (Oregon)",
-    "ap-south-1": "Asia Pacific (Mumbai)",
-    "ap-northeast-1": "Asia Pacific (Tokyo)",
-    "eu-central-1": "EU (Frankfurt)",
-    "eu-west-1": "EU (Ireland)",
-    # Add more if needed
-}
-
-
 os_map = {
     "Linux/UNIX": "Linux",
     "Red Hat Enterprise Linux": "RHEL",
@@ -32,70 +27,157 @@ os_map = {
     "Windows": "Windows"
 }
 
-PROFILE_NAME = os.getenv('AWS_PROFILE')
-session = aioboto3.Session(profile_name=PROFILE_NAME)
 
+# instances analysed before the rest of the fleet, so the first findings of a stream wait for one
+# GetMetricData round of this many instances instead of the whole region's
+EC2_FIRST_BATCH = int(os.getenv('EC2_FIRST_BATCH', 250))
 
-async def find_idle_ec2_instances(region, cpu_threshold=5):
-    try:
-        logger.info(f"######## Checking instances in region {region} with CPU threshold less than {cpu_threshold}% ########")
-        async with session.client('ec2', region_name=region) as ec2:   # ✅
-            async with session.client('cloudwatch', region_name=region) as cw:  # ✅
-        
-            # get all running EC2 instances
-                response = await ec2.describe_instances(Filters=[{'Name': 'instance-state-name', 'Values': ['running']}])
-                idle_instances = []
-                for reserv in response['Reservations']:
-                    for instance in reserv['Instances']:
-                        instance_id = instance['InstanceId']
-                        # get CPU utilization for the last day
-                        metrics = await cw.get_metric_statistics(
-                            Namespace='AWS/EC2',
-                            MetricName='CPUUtilization',
-                            Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-                            StartTime=datetime.utcnow() - timedelta(hours=24),
-                            EndTime=datetime.utcnow(),
-                            Period=3600,  # 1-hour intervals
-                            Statistics=['Average']
+
+EC2_REPORT_FIELDS = ['id', 'average_cpu', 'p95_cpu', 'max_cpu', 'idle_hours_pct', 'network_bytes_per_hour', 'disk_bytes_per_hour',
+                     'classification', 'region', 'hourly_cost', 'monthly_savings', 'instance_type', 'os', 'reason']
+
+
+def _round(value) -> float | str:
+    return '' if np.isnan(value) else round(float(value), 2)
+
+
+async def _fetch_matrix(cw, region: str, instance_ids: list[str], metrics: tuple[str, ...], start_time: datetime,
+                        end_time: datetime, stat: str) -> np.ndarray:
+    # hours already cached from earlier scans are not requested again
+    matrices = await asyncio.gather(*[
+        metric_cache.get_matrix(cw, region, instance_ids, metric, start_time, end_time, stat=stat)
+        for metric in metrics
+    ])
+    return combine(*matrices)
+
+
+async def _analyse(cw, region: str, instance_ids: list[str], cpu_threshold, start_time: datetime, end_time: datetime,
+                   include_network: bool, include_disk: bool, idle_hours_fraction: float):
+    # up to 500 instances per GetMetricData call, all metrics fetched concurrently, hourly buckets
+    fetches = [_fetch_matrix(cw, region, instance_ids, ('CPUUtilization',), start_time, end_time, 'Average')]
+    if include_network:
+        fetches.append(_fetch_matrix(cw, region, instance_ids, NETWORK_METRICS, start_time, end_time, 'Sum'))
+    if include_disk:
+        fetches.append(_fetch_matrix(cw, region, instance_ids, DISK_METRICS, start_time, end_time, 'Sum'))
+    with phase('ec2', 'metrics'):
+        matrices = await asyncio.gather(*fetches)
+    # one vectorized pass over the whole batch
+    with phase('ec2', 'analysis'):
+        cpu = utilization_stats(matrices[0], cpu_threshold)
+        network = utilization_stats(matrices[1]) if include_network else None
+        disk = utilization_stats(matrices[-1]) if include_disk else None
+        labels = classify(cpu, cpu_threshold, network, disk, idle_hours_fraction)
+    return cpu, network, disk, labels
+
+
+async def scan_idle_ec2_instances(region, cpu_threshold=5, pool: ClientPool = client_pool, inventory: RegionInventory | None = None,
+                                  lookback_days: int = 1, include_network: bool = False, include_disk: bool = False,
+                                  idle_hours_fraction: float | None = None) -> ScanEvents:
+    logger.info(f"######## Checking instances in region {region} with CPU threshold less than {cpu_threshold}% over {lookback_days} days ########")
+    cw = await pool.get('cloudwatch', region)
+    # get all running EC2 instances
+    if inventory is None:
+        with phase('ec2', 'describe'):
+            inventory = await load_inventory(region, pool, kinds=('instances',))
+    instances = inventory.running_instances()
+    # whole hours only, so every column of the matrix is one complete period
+    end_time = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start_time = end_time - timedelta(days=lookback_days)
+    if idle_hours_fraction is None:
+        idle_hours_fraction = IDLE_HOURS_FRACTION
+    batches = [instances[:EC2_FIRST_BATCH], instances[EC2_FIRST_BATCH:]]
+    path = report_path(f"idle_ec2_report_{region}.csv")
+    progress = Progress(len(instances))
+    # utilization moves every hour, so findings are always re-evaluated and only the diff is kept
+    async with DeltaScan('ec2', region, path, compare=('classification', 'monthly_savings')) as delta, \
+            ReportSink(path, fieldnames=EC2_REPORT_FIELDS, checker='ec2', region=region, cost_field='monthly_savings') as sink:
+        for batch in batches:
+            if not batch:
+                continue
+            cpu, network, disk, labels = await _analyse(cw, region, [instance.id for instance in batch], cpu_threshold,
+                                                        start_time, end_time, include_network, include_disk, idle_hours_fraction)
+            for row, instance in enumerate(batch):
+                await report_progress()
+                if event := progress.advance():
+                    yield event
+                instance_id = instance.id
+                os_type = instance.platform
+                os_filter = os_map.get(os_type, "Linux")
+                label = labels[row]
+                if label == NO_DATA:
+                    # No data -> might be idle or new instance
+                    findings = {
+                        'id': instance_id,
+                        'classification': label,
+                        'reason': 'No CPU data available'
+                    }
+                    delta.record(instance_id, label, findings)
+                    with phase('ec2', 'report'):
+                        await sink.write(findings)
+                    yield 'finding', findings
+                    continue
+                if label == ACTIVE:
+                    continue
+                findings = {
+                    'id': instance_id,
+                    'average_cpu': _round(cpu.mean[row]),
+                    'p95_cpu': _round(cpu.p95[row]),
+                    'max_cpu': _round(cpu.max[row]),
+                    'idle_hours_pct': _round(cpu.below_fraction[row] * 100),
+                    'network_bytes_per_hour': _round(network.p95[row]) if network else '',
+                    'disk_bytes_per_hour': _round(disk.p95[row]) if disk else '',
+                    'classification': label,
+                    'region': region,
+                    'instance_type': instance.type,
+                    'os': os_type
+                }
+                if label == RIGHTSIZE:
+                    # savings depend on the target size, which is left to the reader
+                    findings['reason'] = f"p95 CPU below {RIGHTSIZE_P95_THRESHOLD:g}%, consider a smaller instance type"
+                    delta.record(instance_id, label, findings)
+                    with phase('ec2', 'report'):
+                        await sink.write(findings)
+                    yield 'finding', findings
+                    continue
+                try:
+                    with phase('ec2', 'pricing'):
+                        hourly_cost = await get_cached_price(
+                            service_code='AmazonEC2',
+                            filters=[
+                                {'Type': 'TERM_MATCH', 'Field': 'instanceType', 'Value': instance.type},
+                                {'Type': 'TERM_MATCH', 'Field': 'location', 'Value': REGION_NAME_MAP.get(region, region)},
+                                {'Type': 'TERM_MATCH', 'Field': 'operatingSystem', 'Value': os_filter},
+                                {'Type': 'TERM_MATCH', 'Field': 'preInstalledSw', 'Value': 'NA'},
+                                # BYOL variants are cheaper and would understate the savings
+                                {'Type': 'TERM_MATCH', 'Field': 'licenseModel', 'Value': 'No License required'},
+                                {'Type': 'TERM_MATCH', 'Field': 'tenancy', 'Value': 'Shared'},
+                                {'Type': 'TERM_MATCH', 'Field': 'capacitystatus', 'Value': 'Used'}
+                            ],
+                            region=region
                         )
-                        os_type = instance.get('PlatformDetails', 'Linux/UNIX')
-                        os_filter = os_map.get(os_type, "Linux")
-                        datapoints = metrics.get('Datapoints', [])
-                        if not datapoints:
-                            # No data -> might be idle or new instance
-                            idle_instances.append({
-                                'id': instance_id,
-                                'reason': 'No CPU data available'
-                            })
-                            continue
-                        avg_cpu = sum(d['Average'] for d in datapoints) / len(datapoints)
-                        if avg_cpu < cpu_threshold:
-                            hourly_cost = await asyncio.to_thread(
-                                get_aws_resource_price,
-                                service_code='AmazonEC2',
-                                filters=[
-                                    {'Type': 'TERM_MATCH', 'Field': 'instanceType', 'Value': instance['InstanceType']},
-                                    {'Type': 'TERM_MATCH', 'Field': 'location', 'Value': REGION_NAME_MAP.get(region, region)},
-                                    {'Type': 'TERM_MATCH', 'Field': 'operatingSystem', 'Value': os_filter},
-                                    {'Type': 'TERM_MATCH', 'Field': 'preInstalledSw', 'Value': 'NA'},
-                                    {'Type': 'TERM_MATCH', 'Field': 'tenancy', 'Value': 'Shared'},
-                                    {'Type': 'TERM_MATCH', 'Field': 'capacitystatus', 'Value': 'Used'}
-                                ],
-                                region=region
-                            )
-                            monthly_savings = hourly_cost * 24 * 30  # Approximate monthly savings
-                            idle_instances.append({
-                                'id': instance_id,
-                                'average_cpu': avg_cpu,
-                                'region': region,
-                                'hourly_cost': hourly_cost,
-                                'monthly_savings': f"{monthly_savings}$",
-                                'instance_type': instance['InstanceType'],
-                                'os': os_type
-                            })
-                await save_to_csv(idle_instances, f"/mnt/BA82FDFB82FDBC47/Python_Devops/boto3/aws-cost-optimizer/reports/idle_ec2_report_{region}.csv")
-                logger.info(f"find_idle_ec2_instances() Method: ✅ Idle EC2 report for region {region} generated.")
-                return JSONResponse(content={"Message": f"Idle EC2 report for region {region} generated."}, status_code=status.HTTP_200_OK)
+                    findings['hourly_cost'] = hourly_cost
+                    findings['monthly_savings'] = f"{hourly_cost * 24 * 30}$"  # Approximate monthly savings
+                except AmbiguousPriceError as err:
+                    # only this instance goes unpriced, the rest of the scan carries on
+                    logger.error(f"Error in scan_idle_ec2_instances() Method: ❌ {instance_id} left unpriced: {err}")
+                    findings['monthly_savings'] = 'unknown'
+                delta.record(instance_id, label, findings)
+                with phase('ec2', 'report'):
+                    await sink.write(findings)
+                yield 'finding', findings
+    logger.info(f"find_idle_ec2_instances() Method: ✅ Idle EC2 report for region {region} generated.")
+    yield 'done', {'Message': f"Idle EC2 report for region {region} generated.", 'report': sink.path.name,
+                   'rows': sink.rows, 'monthly_cost': round(sink.total_cost, 2)}
+
+
+async def find_idle_ec2_instances(region, cpu_threshold=5, pool: ClientPool = client_pool, inventory: RegionInventory | None = None,
+                                  lookback_days: int = 1, include_network: bool = False, include_disk: bool = False,
+                                  idle_hours_fraction: float | None = None):
+    try:
+        summary = await drain(scan_idle_ec2_instances(region, cpu_threshold, pool, inventory, lookback_days, include_network, include_disk,
+                                                      idle_hours_fraction))
+        return JSONResponse(content={"Message": f"Idle EC2 report for region {region} generated.", "Report": summary["report"],
+                                     "MonthlyCost": summary["monthly_cost"]}, status_code=status.HTTP_200_OK)
     except ClientError as err:
         logger.error(f"Error in find_idle_ec2_instances() Method: ❌ AWS ClientError: {err}")
         return JSONResponse(content={"Error": f"AWS ClientError: {err}"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
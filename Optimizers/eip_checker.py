@@ -1,87 +1,109 @@
-import aioboto3
 from botocore.exceptions import ClientError
-from utils.utils import get_instance_state, save_to_csv, get_aws_resource_price
-from dotenv import load_dotenv
+from utils.report_sink import ReportSink, report_path
+from utils.client_pool import ClientPool, client_pool
+from utils.inventory import AddressRecord, RegionInventory, load_inventory
+from utils.delta import DeltaScan, fingerprint
+from utils.jobs import phase, report_progress
+from utils.price_cache import get_cached_price
+from utils.streaming import Progress, ScanEvents, drain
 from fastapi import status
 from fastapi.responses import JSONResponse
 from logger import logger
-import os 
 
-load_dotenv('.env')
 
+DEFAULT_IPV4_HOURLY_PRICE = 0.005  # public IPv4 list price, used when no price list is reachable
 
-PROFILE_NAME = os.getenv('AWS_PROFILE')
 
+EIP_REPORT_FIELDS = ['PublicIp', 'AllocationId', 'AttachmentType', 'AttachmentId', 'InstanceState', 'Domain', 'IsIdle', 'MonthlyCost($)']
 
-REGION_NAME_MAP = {
-    "us-east-1": "US East (N. Virginia)",
-    "us-east-2": "US East (Ohio)",
-    "us-west-1": "US West (N. California)",
-    "us-west-2": "US West (Oregon)",
-    "ap-south-1": "Asia Pacific (Mumbai)",
-    "ap-northeast-1": "Asia Pacific (Tokyo)",
-    "eu-central-1": "EU (Frankfurt)",
-    "eu-west-1": "EU (Ireland)",
-    # Add more if needed
-}
 
+def _evaluate_address(addr: AddressRecord, inventory: RegionInventory, eip_monthly_price: float) -> dict:
+    nat_map = inventory.nat_by_allocation
+    allocation_id = addr.allocation_id
+    public_ip = addr.public_ip
+    instance_id = addr.instance_id
+    network_interface_id = addr.network_interface_id
+    domain = addr.domain # vpc or standard
+    if allocation_id in nat_map:
+        # EIP is associated with a NAT Gateway
+        attachment_type = 'NAT Gateway'
+        attachment_id = nat_map[allocation_id]
+        state = 'Managed by AWS'
+    elif instance_id != 'N/A':
+        attachment_type = 'EC2 Instance'
+        attachment_id = instance_id
+        instance = inventory.instances.get(instance_id)
+        state = instance.state if instance else 'Unknown'
+    elif network_interface_id != 'N/A':
+        # Standard EIP attached to a network interface (not directly to an instance)
+        attachment_type = 'Network Interface'
+        attachment_id = network_interface_id
+        state = 'N/A'
+    else:
+        # Completly unattached EIP
+        attachment_type = 'Unattached'
+        attachment_id = 'N/A'
+        state = 'Available/Not attached'
+    return {
+        'PublicIp': public_ip,
+        'AllocationId': allocation_id,
+        'AttachmentType': attachment_type,
+        'AttachmentId': attachment_id,
+        'InstanceState': state,
+        'Domain': domain,
+        'IsIdle': attachment_type == 'Unattached',
+        'MonthlyCost($)': f"${eip_monthly_price}" if attachment_type == 'Unattached' else "$0.00"
+    }
 
 
-async def list_unattached_eips(region: str) -> None:
+async def scan_unattached_eips(region: str, pool: ClientPool = client_pool, inventory: RegionInventory | None = None) -> ScanEvents:
+    if inventory is None:
+        with phase('eip', 'describe'):
+            inventory = await load_inventory(region, pool, kinds=('instances', 'addresses', 'nat_gateways'))
+    nat_map = inventory.nat_by_allocation
     try:
-        eip_data = []
-        async with aioboto3.Session(profile_name=PROFILE_NAME).client('ec2', region_name=region) as ec2:
-            addresses = (await ec2.describe_addresses()).get('Addresses', [])
-            instances = await get_instance_state(ec2)
-            nat_gateways = (await ec2.describe_nat_gateways()).get('NatGateways', [])
-            nat_map = {
-                gw_addr['AllocationId']: gw['NatGatewayId']
-                for gw in nat_gateways
-                for gw_addr in gw.get('NatGatewayAddresses', [])
-                if 'AllocationId' in gw_addr
-            }
-            eip_hourly_price = 0.005 
-            eip_monthly_price = round(eip_hourly_price * 720, 4)  # Assuming 720 hours in a month
-            # Process each EIP
-            for addr in addresses:
-                allocation_id = addr.get('AllocationId', 'N/A')
-                public_ip = addr.get('PublicIp', 'N/A')
-                instance_id = addr.get('InstanceId', 'N/A')
-                network_interface_id = addr.get('NetworkInterfaceId', 'N/A')
-                domain = addr.get('Domain', 'N/A') # vpc or standard
-                if allocation_id in nat_map:
-                    # EIP is associated with a NAT Gateway
-                    attachment_type = 'NAT Gateway'
-                    attachment_id = nat_map[allocation_id]
-                    state = 'Managed by AWS'
-                elif instance_id != 'N/A':
-                    attachment_type = 'EC2 Instance'
-                    attachment_id = instance_id
-                    state = next((inst['state'] for inst in instances if inst['id'] == instance_id), 'Unknown')
-                elif network_interface_id != 'N/A':
-                    # Standard EIP attached to a network interface (not directly to an instance)
-                    attachment_type = 'Network Interface'
-                    attachment_id = network_interface_id
-                    state = 'N/A'
-                else:
-                    # Completly unattached EIP
-                    attachment_type = 'Unattached'
-                    attachment_id = 'N/A'
-                    state = 'Available/Not attached'
-                
-                eip_data.append({
-                    'PublicIp': public_ip,
-                    'AllocationId': allocation_id,
-                    'AttachmentType': attachment_type,
-                    'AttachmentId': attachment_id,
-                    'InstanceState': state,
-                    'Domain': domain,
-                    'IsIdle': attachment_type == 'Unattached',
-                    'MonthlyCost($)': f"${eip_monthly_price}" if attachment_type == 'Unattached' else "$0.00"
-                })
-        await save_to_csv((eip_data), f"/mnt/BA82FDFB82FDBC47/Python_Devops/boto3/aws-cost-optimizer/reports/eip_report_{region}.csv")
-        logger.info(f"eip_optimizer() Method: ✅ EIP report for region {region} generated.")
-        return JSONResponse(content={"Message": f"EIP report for region {region} generated."}, status_code=status.HTTP_200_OK)
+        with phase('eip', 'pricing'):
+            eip_hourly_price = await get_cached_price(
+                service_code='AmazonVPC',
+                filters=[
+                    {'Type': 'TERM_MATCH', 'Field': 'productFamily', 'Value': 'VPC Public IPv4 Address'},
+                    {'Type': 'TERM_MATCH', 'Field': 'group', 'Value': 'VPCPublicIPv4Address'},
+                ],
+                region=region
+            )
+    except Exception as err:
+        logger.error(f"eip_optimizer() Method: ❌ Falling back to ${DEFAULT_IPV4_HOURLY_PRICE}/hr for public IPv4: {err}")
+        eip_hourly_price = DEFAULT_IPV4_HOURLY_PRICE
+    eip_monthly_price = round(eip_hourly_price * 720, 4)  # Assuming 720 hours in a month
+    # Process each EIP
+    path = report_path(f"eip_report_{region}.csv")
+    progress = Progress(len(inventory.addresses))
+    async with DeltaScan('eip', region, path) as delta, \
+            ReportSink(path, fieldnames=EIP_REPORT_FIELDS, checker='eip', region=region, cost_field='MonthlyCost($)') as sink:
+        for addr in inventory.addresses.values():
+            await report_progress()
+            instance = inventory.instances.get(addr.instance_id)
+            addr_fingerprint = fingerprint(addr.public_ip, addr.instance_id, addr.network_interface_id, addr.domain,
+                                           nat_map.get(addr.allocation_id), instance.state if instance else None)
+            unchanged, finding = delta.lookup(addr.allocation_id, addr_fingerprint)
+            if not unchanged:
+                finding = _evaluate_address(addr, inventory, eip_monthly_price)
+                delta.record(addr.allocation_id, addr_fingerprint, finding)
+            with phase('eip', 'report'):
+                await sink.write(finding)
+            yield 'finding', finding
+            if event := progress.advance():
+                yield event
+    logger.info(f"eip_optimizer() Method: ✅ EIP report for region {region} generated.")
+    yield 'done', {'Message': f"EIP report for region {region} generated.", 'report': sink.path.name,
+                   'rows': sink.rows, 'monthly_cost': round(sink.total_cost, 2)}
+
+
+async def list_unattached_eips(region: str, pool: ClientPool = client_pool, inventory: RegionInventory | None = None) -> None:
+    try:
+        summary = await drain(scan_unattached_eips(region, pool, inventory))
+        return JSONResponse(content={"Message": f"EIP report for region {region} generated.", "Report": summary["report"],
+                                     "MonthlyCost": summary["monthly_cost"]}, status_code=status.HTTP_200_OK)
     except ClientError as err:
         logger.error(f"eip_optimizer() Method: ❌ Error fetching EIP data in region {region}: {err}")
         return JSONResponse(content={"Error": f"AWS ClientError: {err}"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
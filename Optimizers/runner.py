@@ -0,0 +1,94 @@
+import asyncio
+import importlib
+import json
+import time
+from botocore.exceptions import ClientError
+from logger import bind_log_context, logger
+from utils.client_pool import ClientPool, client_pool
+from utils.inventory import RegionInventory, load_inventory
+from utils.jobs import phase
+
+
+EC2_OPTIONS = ('cpu_threshold', 'lookback_days', 'include_network', 'include_disk', 'idle_hours_fraction')  # request fields passed to the ec2 checker
+
+
+def _checker(module: str, name: str):
+    # checker modules (numpy, the metric cache, ...) are imported by the first scan, not at startup
+    return getattr(importlib.import_module(f"Optimizers.{module}"), name)
+
+
+# inventory=None -> the checker describes what it needs itself
+CHECKERS = {
+    'eip': lambda region, ec2_options, pool, inventory: _checker('eip_checker', 'list_unattached_eips')(region=region, pool=pool, inventory=inventory),
+    'ebs': lambda region, ec2_options, pool, inventory: _checker('ebs_checker', 'list_unused_ebs')(region=region, pool=pool, inventory=inventory),
+    'ec2': lambda region, ec2_options, pool, inventory: _checker('ec2_checker', 'find_idle_ec2_instances')(region=region, pool=pool, inventory=inventory, **ec2_options),
+    # needs every volume id and the AMIs, not the shared snapshot of available volumes
+    'snapshot': lambda region, ec2_options, pool, inventory: _checker('snapshot_checker', 'list_orphaned_snapshots')(region=region, pool=pool),
+}
+
+
+async def get_enabled_regions(pool: ClientPool = client_pool) -> list[str]:
+    try:
+        ec2 = await pool.get('ec2', 'us-east-1')
+        resp = await ec2.describe_regions(AllRegions=False)
+        return sorted(r['RegionName'] for r in resp['Regions'])
+    except ClientError as err:
+        logger.error(f"Error in runner.get_enabled_regions() Method: ❌ AWS ClientError: {err}")
+        raise
+
+
+async def resolve_regions(region: str, regions: list[str] | None, pool: ClientPool = client_pool) -> list[str]:
+    if not regions:
+        return [region]
+    if any(r.lower() == 'all' for r in regions):
+        return await get_enabled_regions(pool)
+    return list(dict.fromkeys(regions))  # drop duplicates, keep order
+
+
+async def _load_inventory(region: str, pool: ClientPool) -> RegionInventory:
+    with phase('refresh', 'describe'):
+        return await load_inventory(region, pool)
+
+
+async def _run_checker(name: str, region: str, ec2_options: dict, pool: ClientPool, inventory: asyncio.Task,
+                       global_limit: asyncio.Semaphore, region_limit: asyncio.Semaphore) -> dict:
+    with bind_log_context(checker=name, region=region):
+        async with global_limit, region_limit:
+            started = time.perf_counter()
+            try:
+                # every checker of a region reads the same snapshot, the describe calls run once
+                snapshot: RegionInventory = await asyncio.shield(inventory)
+                response = await CHECKERS[name](region, ec2_options, pool, snapshot)
+                body = json.loads(response.body)
+                ok = response.status_code < 400
+                result = {'status': 'ok' if ok else 'error', 'detail': body.get('Message') if ok else body.get('Error')}
+                if ok:
+                    result['report'] = body.get('Report')  # file name, in the account's directory for account scans
+                    result['monthly_cost'] = body.get('MonthlyCost')
+            except Exception as err:
+                logger.error(f"Error in runner._run_checker() Method: ❌ {name} checker failed in {region}: {err}")
+                result = {'status': 'error', 'detail': str(err)}
+            result['seconds'] = round(time.perf_counter() - started, 3)
+            return result
+
+
+async def refresh_regions(regions: list[str], ec2_options: dict, max_concurrency: int = 8, region_concurrency: int = 3,
+                          pool: ClientPool = client_pool) -> dict:
+    started = time.perf_counter()
+    global_limit = asyncio.Semaphore(max_concurrency)
+    region_limits = {region: asyncio.Semaphore(region_concurrency) for region in regions}
+    inventories = {region: asyncio.create_task(_load_inventory(region, pool)) for region in regions}
+    units = [(region, name) for region in regions for name in CHECKERS]
+    results = await asyncio.gather(*[
+        _run_checker(name, region, ec2_options, pool, inventories[region], global_limit, region_limits[region])
+        for region, name in units
+    ])
+    report = {region: {} for region in regions}
+    for (region, name), result in zip(units, results):
+        report[region][name] = result
+    logger.info(f"runner.refresh_regions() Method: ✅ Refreshed {len(regions)} regions in {time.perf_counter() - started:.2f}s")
+    return {
+        'regions': report,
+        'seconds': round(time.perf_counter() - started, 3),
+        'failed': sum(1 for r in results if r['status'] != 'ok'),
+    }
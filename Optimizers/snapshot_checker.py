@@ -0,0 +1,121 @@
+from botocore.exceptions import ClientError
+from utils.report_sink import ReportSink, report_path
+from utils.client_pool import ClientPool, client_pool
+from utils.jobs import phase, report_progress
+from utils.price_cache import get_cached_price
+from utils.streaming import Progress, ScanEvents, drain
+from fastapi import status
+from fastapi.responses import JSONResponse
+from logger import logger
+import asyncio
+import datetime
+
+
+GIB = 1024 ** 3
+# DescribeSnapshots StorageTier -> pricing storageMedia of the snapshot storage SKU
+SNAPSHOT_STORAGE_MEDIA = {
+    'standard': 'Amazon S3',
+    'archive': 'Amazon S3 Glacier',
+}
+
+
+SNAPSHOT_REPORT_FIELDS = ['SnapshotId', 'VolumeId', 'Size(GB)', 'StorageTier', 'StartTime', 'Description', 'Region', 'MonthlyCost($)']
+
+
+async def _existing_volume_ids(ec2) -> set[str]:
+    # every volume in any state; only the ids are kept, a snapshot just needs to know its source is gone
+    volume_ids = set()
+    async for page in ec2.get_paginator('describe_volumes').paginate():
+        volume_ids.update(vol['VolumeId'] for vol in page.get('Volumes', []))
+    return volume_ids
+
+
+async def _ami_snapshot_ids(ec2) -> set[str]:
+    # snapshots backing a registered AMI can't be deleted while the AMI exists, disabled AMIs included
+    snapshot_ids = set()
+    async for page in ec2.get_paginator('describe_images').paginate(Owners=['self'], IncludeDeprecated=True, IncludeDisabled=True):
+        for image in page.get('Images', []):
+            for mapping in image.get('BlockDeviceMappings', []):
+                snapshot_id = mapping.get('Ebs', {}).get('SnapshotId')
+                if snapshot_id:
+                    snapshot_ids.add(snapshot_id)
+    return snapshot_ids
+
+
+async def _gb_month_prices(region: str) -> dict[str, float]:
+    # one price per storage tier, every snapshot of the region is priced from this dict;
+    # a tier without a price is left out and its snapshots are reported with an unknown cost
+    prices = {}
+    for tier, storage_media in SNAPSHOT_STORAGE_MEDIA.items():
+        try:
+            prices[tier] = await get_cached_price(
+                service_code='AmazonEC2',
+                filters=[
+                    {"Field": "productFamily", "Value": "Storage Snapshot"},
+                    {"Field": "storageMedia", "Value": storage_media},
+                ],
+                region=region
+            )
+        except Exception as err:
+            logger.error(f"Error in snapshot_checker._gb_month_prices() Method: ❌ no {tier} snapshot price for {region}: {err}")
+    return prices
+
+
+def _evaluate_snapshot(snap: dict, volume_ids: set[str], ami_snapshot_ids: set[str], prices: dict[str, float], region: str) -> dict | None:
+    if snap['VolumeId'] in volume_ids or snap['SnapshotId'] in ami_snapshot_ids:
+        return None
+    tier = snap.get('StorageTier', 'standard')
+    # the full size is an upper bound, incremental snapshots of one volume share unchanged blocks
+    size_gb = snap['FullSnapshotSizeInBytes'] / GIB if snap.get('FullSnapshotSizeInBytes') else snap.get('VolumeSize', 0)
+    price = prices.get(tier)
+    return {
+        'SnapshotId': snap['SnapshotId'],
+        'VolumeId': snap['VolumeId'],
+        'Size(GB)': round(size_gb, 2),
+        'StorageTier': tier,
+        'StartTime': snap['StartTime'].isoformat() if isinstance(snap.get('StartTime'), datetime.datetime) else snap.get('StartTime', ''),
+        'Description': snap.get('Description', ''),
+        'Region': region,
+        'MonthlyCost($)': f"${round(price * size_gb, 4)}" if price is not None else 'unknown',
+    }
+
+
+async def scan_orphaned_snapshots(region: str, pool: ClientPool = client_pool) -> ScanEvents:
+    logger.info(f"############ Executing orphaned snapshot checker at time {datetime.datetime.now()} ############")
+    ec2 = await pool.get('ec2', region)
+    # volumes and AMIs become hash sets first, then the snapshots stream past them page by page,
+    # so only the orphaned ones are ever held and each lookup is O(1)
+    with phase('snapshot', 'describe'):
+        volume_ids, ami_snapshot_ids = await asyncio.gather(_existing_volume_ids(ec2), _ami_snapshot_ids(ec2))
+    with phase('snapshot', 'pricing'):
+        prices = await _gb_month_prices(region)
+    path = report_path(f"orphaned_snapshots_{region}.csv")
+    progress = Progress()  # snapshots are paged in, the total is unknown until the last page
+    async with ReportSink(path, fieldnames=SNAPSHOT_REPORT_FIELDS, checker='snapshot', region=region, cost_field='MonthlyCost($)') as sink:
+        async for page in ec2.get_paginator('describe_snapshots').paginate(OwnerIds=['self']):
+            snapshots = page.get('Snapshots', [])
+            await report_progress(len(snapshots))
+            findings = [f for snap in snapshots if (f := _evaluate_snapshot(snap, volume_ids, ami_snapshot_ids, prices, region))]
+            with phase('snapshot', 'report'):
+                await sink.write_many(findings)
+            for finding in findings:
+                yield 'finding', finding
+            if event := progress.advance(len(snapshots)):
+                yield event
+    logger.info(f"✅ Orphaned snapshot report generated and saved to {path}: {sink.rows} of {progress.processed} snapshots orphaned "
+                f"({len(volume_ids)} volumes, {len(ami_snapshot_ids)} AMI snapshots)")
+    yield 'done', {'Message': f"Orphaned snapshot report for region {region} generated.", 'report': sink.path.name, 'rows': sink.rows,
+                   'monthly_cost': round(sink.total_cost, 2)}
+
+
+async def list_orphaned_snapshots(region: str, pool: ClientPool = client_pool) -> JSONResponse:
+    try:
+        summary = await drain(scan_orphaned_snapshots(region, pool))
+        return JSONResponse(content={"Message": f"Orphaned snapshot report for region {region} generated.", "Report": summary["report"],
+                                     "MonthlyCost": summary["monthly_cost"]}, status_code=status.HTTP_200_OK)
+    except ClientError as err:
+        logger.error(f"❌ AWS ClientError: {err}")
+        return JSONResponse(content={"Error": f"AWS ClientError: {err}"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as err:
+        logger.error(f"❌ Unexpected error: {err}")
+        return JSONResponse(content={"Error": f"Unexpected error: {err}"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,266 @@
+import asyncio
+import random
+from collections import Counter
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+
+
+# In-process stand-ins for the EC2, CloudWatch and Cost Explorer clients the app uses. Every call sleeps
+# `latency` seconds and is counted, pages are cut at the real service page sizes.
+DESCRIBE_PAGE_SIZE = 1000
+METRIC_DATAPOINTS_PER_RESPONSE = 100_800  # GetMetricData response limit
+INSTANCE_TYPES = ('t3.micro', 't3.medium', 'm5.large', 'm5.xlarge', 'c5.2xlarge')
+VOLUME_TYPES = ('gp2', 'gp3', 'io1', 'st1')
+# fleet shares: (profile, share, hourly CPU %)
+CPU_PROFILES = (('idle', 0.3, 1.0), ('rightsize', 0.2, 20.0), ('busy', 0.5, 60.0))
+# Cost Explorer pages through groups, deliberately not a multiple of the services per day so days span pages
+COST_GROUPS_PER_PAGE = 64
+
+
+class FakeEvents:
+    # the slice of botocore's hierarchical emitter the rate limiter hooks into
+    def __init__(self):
+        self._handlers: list[tuple[str, object]] = []
+
+    def register(self, event_name: str, handler) -> None:
+        self._handlers.append((event_name, handler))
+
+    async def emit(self, event_name: str, **kwargs) -> list:
+        return [await handler(event_name=event_name, **kwargs) for name, handler in self._handlers
+                if event_name == name or event_name.startswith(f'{name}.')]
+
+
+class FakeMeta:
+    def __init__(self, region: str, operations: dict[str, str]):
+        self.region_name = region
+        self.method_to_api_mapping = operations
+        self.events = FakeEvents()
+
+
+class FakePaginator:
+    def __init__(self, method):
+        self._method = method
+
+    async def paginate(self, **kwargs):
+        while True:
+            page = await self._method(**kwargs)
+            yield page
+            if not page.get('NextToken'):
+                return
+            kwargs['NextToken'] = page['NextToken']
+
+
+class FakeClient:
+    def __init__(self, region: str, latency: float, calls: Counter):
+        self.region = region
+        self.latency = latency
+        self.calls = calls
+
+    async def _call(self, operation: str) -> None:
+        # one HTTP attempt per loop, announced the way botocore's endpoint does it
+        model = SimpleNamespace(name=operation)
+        attempts = 0
+        while True:
+            attempts += 1
+            await self.meta.events.emit(f'before-send.fake.{operation}', request=None)
+            self.calls[operation] += 1
+            await asyncio.sleep(self.latency)
+            delays = await self.meta.events.emit(f'needs-retry.fake.{operation}', attempts=attempts, operation=model,
+                                                 response=(SimpleNamespace(status_code=200), {}), caught_exception=None)
+            delay = next((d for d in delays if d is not None), None)
+            if delay is None:
+                return
+            await asyncio.sleep(delay)
+
+    def get_paginator(self, operation_name: str) -> FakePaginator:
+        return FakePaginator(getattr(self, operation_name))
+
+
+def _page(items: list, kwargs: dict) -> tuple[list, str | None]:
+    start = int(kwargs.get('NextToken') or 0)
+    end = start + DESCRIBE_PAGE_SIZE
+    return items[start:end], (str(end) if end < len(items) else None)
+
+
+def _matches(item_value: str, filters: list[dict], name: str) -> bool:
+    for f in filters or []:
+        if f['Name'] == name and item_value not in f['Values']:
+            return False
+    return True
+
+
+class FakeEC2(FakeClient):
+    def __init__(self, region: str, size: int, latency: float, calls: Counter, seed: int = 42):
+        super().__init__(region, latency, calls)
+        self.meta = FakeMeta(region, {name: ''.join(p.title() for p in name.split('_')) for name in (
+            'describe_instances', 'describe_volumes', 'describe_addresses', 'describe_nat_gateways', 'describe_regions',
+            'describe_snapshots', 'describe_images')})
+        rng = random.Random(seed)
+        self.instances = [{
+            'InstanceId': f'i-{k:08x}',
+            'State': {'Name': 'running' if rng.random() < 0.9 else 'stopped'},
+            'InstanceType': rng.choice(INSTANCE_TYPES),
+            'PlatformDetails': 'Linux/UNIX',
+        } for k in range(size)]
+        self.volumes = [{
+            'VolumeId': f'vol-{k:08x}',
+            'Size': rng.choice((8, 20, 100, 500)),
+            'VolumeType': rng.choice(VOLUME_TYPES),
+            'State': 'available' if rng.random() < 0.4 else 'in-use',
+            'Attachments': [],
+        } for k in range(size)]
+        nat_count = max(1, size // 100)
+        self.addresses = []
+        for k in range(size):
+            addr = {'AllocationId': f'eipalloc-{k:08x}', 'PublicIp': f'10.{k >> 16 & 255}.{k >> 8 & 255}.{k & 255}', 'Domain': 'vpc'}
+            roll = rng.random()
+            if roll < 0.4:
+                addr['InstanceId'] = self.instances[k]['InstanceId']
+            elif roll < 0.7:
+                addr['NetworkInterfaceId'] = f'eni-{k:08x}'
+            self.addresses.append(addr)
+        # snapshots: 60% of a live volume, the rest of deleted ones; every 4th AMI-less candidate backs an AMI
+        self.snapshots = []
+        for k in range(size):
+            live = rng.random() < 0.6
+            self.snapshots.append({
+                'SnapshotId': f'snap-{k:08x}',
+                'VolumeId': self.volumes[k]['VolumeId'] if live else f'vol-gone{k:08x}',
+                'VolumeSize': rng.choice((8, 20, 100)),
+                'StorageTier': 'standard',
+                'StartTime': datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(hours=k),
+                'State': 'completed',
+            })
+        self.images = [{
+            'ImageId': f'ami-{k:08x}',
+            'BlockDeviceMappings': [{'DeviceName': '/dev/xvda', 'Ebs': {'SnapshotId': snap['SnapshotId']}}],
+        } for k, snap in enumerate(self.snapshots[::4])]
+        self.nat_gateways = [{
+            'NatGatewayId': f'nat-{k:08x}',
+            'NatGatewayAddresses': [{'AllocationId': self.addresses[k]['AllocationId']}],
+        } for k in range(nat_count)]
+
+    async def describe_instances(self, Filters=None, **kwargs):
+        await self._call('DescribeInstances')
+        items = [i for i in self.instances if _matches(i['State']['Name'], Filters, 'instance-state-name')]
+        page, token = _page(items, kwargs)
+        return {'Reservations': [{'Instances': page}], 'NextToken': token}
+
+    async def describe_volumes(self, Filters=None, **kwargs):
+        await self._call('DescribeVolumes')
+        items = [v for v in self.volumes if _matches(v['State'], Filters, 'status')]
+        page, token = _page(items, kwargs)
+        return {'Volumes': page, 'NextToken': token}
+
+    async def describe_addresses(self, **kwargs):
+        await self._call('DescribeAddresses')
+        return {'Addresses': self.addresses}
+
+    async def describe_nat_gateways(self, Filter=None, **kwargs):
+        await self._call('DescribeNatGateways')
+        page, token = _page(self.nat_gateways, kwargs)
+        return {'NatGateways': page, 'NextToken': token}
+
+    async def describe_snapshots(self, **kwargs):
+        await self._call('DescribeSnapshots')
+        page, token = _page(self.snapshots, kwargs)
+        return {'Snapshots': page, 'NextToken': token}
+
+    async def describe_images(self, **kwargs):
+        await self._call('DescribeImages')
+        page, token = _page(self.images, kwargs)
+        return {'Images': page, 'NextToken': token}
+
+    async def describe_regions(self, **kwargs):
+        await self._call('DescribeRegions')
+        return {'Regions': [{'RegionName': self.region}]}
+
+
+class FakeCloudWatch(FakeClient):
+    def __init__(self, region: str, latency: float, calls: Counter, seed: int = 42):
+        super().__init__(region, latency, calls)
+        self.meta = FakeMeta(region, {'get_metric_data': 'GetMetricData'})
+        self.seed = seed
+
+    def _profile(self, instance_id: str) -> float:
+        roll = random.Random(f'{self.seed}-{instance_id}').random()
+        for _, share, cpu in CPU_PROFILES:
+            if roll < share:
+                return cpu
+            roll -= share
+        return CPU_PROFILES[-1][2]
+
+    async def get_metric_data(self, MetricDataQueries, StartTime, EndTime, NextToken=None, **kwargs):
+        await self._call('GetMetricData')
+        hours = int((EndTime - StartTime).total_seconds() // 3600)
+        start = StartTime.astimezone(timezone.utc) if StartTime.tzinfo else StartTime.replace(tzinfo=timezone.utc)
+        timestamps = [start + timedelta(hours=h) for h in range(hours)]
+        # queries are answered whole, a page ends once the datapoint budget is spent
+        first = int(NextToken or 0)
+        per_page = max(1, METRIC_DATAPOINTS_PER_RESPONSE // max(hours, 1))
+        results = []
+        for query in MetricDataQueries[first:first + per_page]:
+            metric = query['MetricStat']['Metric']
+            instance_id = metric['Dimensions'][0]['Value']
+            value = self._profile(instance_id) if metric['MetricName'] == 'CPUUtilization' else 1024.0
+            results.append({'Id': query['Id'], 'Timestamps': timestamps, 'Values': [value] * hours})
+        last = first + per_page
+        return {'MetricDataResults': results, 'NextToken': str(last) if last < len(MetricDataQueries) else None}
+
+
+class FakeCostExplorer(FakeClient):
+    def __init__(self, region: str, size: int, latency: float, calls: Counter):
+        super().__init__(region, latency, calls)
+        self.meta = FakeMeta(region, {'get_cost_and_usage': 'GetCostAndUsage'})
+        self.services = [f'Service {n}' for n in range(max(1, size // 100))]
+
+    @staticmethod
+    def amount(day: str, service: str) -> float:
+        return round(random.Random(f'{day}-{service}').uniform(0.1, 100.0), 4)
+
+    async def get_cost_and_usage(self, TimePeriod, Granularity, Metrics, GroupBy=None, NextPageToken=None, **kwargs):
+        await self._call('GetCostAndUsage')
+        start, end = datetime.fromisoformat(TimePeriod['Start']), datetime.fromisoformat(TimePeriod['End'])
+        days = [(start + timedelta(days=d)).date().isoformat() for d in range((end - start).days)]
+        metric = Metrics[0]
+        if not GroupBy:
+            return {'ResultsByTime': [{
+                'TimePeriod': {'Start': day, 'End': day}, 'Estimated': False, 'Groups': [],
+                'Total': {metric: {'Amount': str(sum(self.amount(day, s) for s in self.services)), 'Unit': 'USD'}},
+            } for day in days]}
+        groups = [(day, service) for day in days for service in self.services]
+        first = int(NextPageToken or 0)
+        last = first + COST_GROUPS_PER_PAGE
+        results = []
+        for day, service in groups[first:last]:
+            if not results or results[-1]['TimePeriod']['Start'] != day:
+                results.append({'TimePeriod': {'Start': day, 'End': day}, 'Estimated': False, 'Total': {}, 'Groups': []})
+            results[-1]['Groups'].append({'Keys': [service], 'Metrics': {metric: {'Amount': str(self.amount(day, service)), 'Unit': 'USD'}}})
+        return {'ResultsByTime': results, 'NextPageToken': str(last) if last < len(groups) else None}
+
+
+class FakePool:
+    # drop-in for ClientPool; clients go through the same rate limiter as real ones
+    def __init__(self, size: int, latency: float, limiter=None):
+        self.calls = Counter()
+        self.size = size
+        self.latency = latency
+        self.limiter = limiter
+        self._clients = {}
+
+    async def get(self, service: str, region: str, profile: str | None = None):
+        key = (service, region)
+        if key not in self._clients:
+            if service == 'ec2':
+                client = FakeEC2(region, self.size, self.latency, self.calls)
+            elif service == 'cloudwatch':
+                client = FakeCloudWatch(region, self.latency, self.calls)
+            elif service == 'ce':
+                client = FakeCostExplorer(region, self.size, self.latency, self.calls)
+            else:
+                raise ValueError(f"No fake for {service}")
+            self._clients[key] = self.limiter.wrap(client, service, region) if self.limiter else client
+        return self._clients[key]
+
+    async def close(self) -> None:
+        self._clients.clear()
@@ -0,0 +1,209 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / 'benchmarks' / 'results'
+REGION = 'us-east-1'
+SIZES = (1000, 10000, 50000)
+SCENARIOS = ('ec2', 'ebs', 'eip', 'snapshot', 'refresh', 'refresh_warm', 'costs')
+COST_DAYS = 14
+# the checkers' scan generators, read directly to time the first finding a stream client would see;
+# imported per scenario so one checker's dependencies don't count towards another's peak RSS
+SCANS = {
+    'ec2': ('ec2_checker', 'scan_idle_ec2_instances'),
+    'ebs': ('ebs_checker', 'scan_unused_ebs'),
+    'eip': ('eip_checker', 'scan_unattached_eips'),
+    'snapshot': ('snapshot_checker', 'scan_orphaned_snapshots'),
+}
+
+
+def _seed_prices(db_path: Path) -> None:
+    # a tiny bulk-price-list offer so the scan prices offline instead of calling the Pricing API
+    from benchmarks.fake_aws import INSTANCE_TYPES, VOLUME_TYPES
+    from Optimizers.ebs_checker import EBS_PRICING_TYPE_MAP
+    from utils.offline_pricing import import_offer_files
+    from utils.regions import REGION_NAME_MAP
+    location = REGION_NAME_MAP[REGION]
+    products, terms = {}, {}
+
+    def add(sku: str, family: str, price: float, unit: str, **attributes):
+        products[sku] = {'productFamily': family, 'attributes': {'location': location, **attributes}}
+        terms[sku] = {f'{sku}.T': {'priceDimensions': {f'{sku}.T.D': {'beginRange': '0', 'unit': unit, 'pricePerUnit': {'USD': str(price)}}}}}
+
+    for n, instance_type in enumerate(INSTANCE_TYPES):
+        add(f'ec2-{n}', 'Compute Instance', 0.01 * 2 ** n, 'Hrs', servicecode='AmazonEC2', instanceType=instance_type,
+            operatingSystem='Linux', preInstalledSw='NA', licenseModel='No License required', tenancy='Shared', capacitystatus='Used')
+        # a BYOL variant of the same instance, the checker's filters must never pick it
+        add(f'ec2-byol-{n}', 'Compute Instance', 0.001 * 2 ** n, 'Hrs', servicecode='AmazonEC2', instanceType=instance_type,
+            operatingSystem='Linux', preInstalledSw='NA', licenseModel='Bring your own license', tenancy='Shared', capacitystatus='Used')
+    for n, volume_type in enumerate(VOLUME_TYPES):
+        add(f'ebs-{n}', 'Storage', 0.05 + 0.02 * n, 'GB-Mo', servicecode='AmazonEC2',
+            volumeType=EBS_PRICING_TYPE_MAP[volume_type], volumeApiName=volume_type)
+    add('snap-0', 'Storage Snapshot', 0.05, 'GB-Mo', servicecode='AmazonEC2', storageMedia='Amazon S3')
+    add('snap-1', 'Storage Snapshot', 0.0125, 'GB-Mo', servicecode='AmazonEC2', storageMedia='Amazon S3 Glacier')
+    add('vpc-0', 'VPC Public IPv4 Address', 0.005, 'Hrs', servicecode='AmazonVPC', group='VPCPublicIPv4Address')
+    offer = db_path.with_suffix('.json')
+    offer.write_text(json.dumps({'offerCode': 'AmazonEC2', 'products': products, 'terms': {'OnDemand': terms}}))
+    import_offer_files([offer], db_path)
+
+
+async def _costs(pool) -> dict:
+    # daily costs grouped by service; the fake cuts pages mid-day, every (day, service) must survive the merge
+    import datetime
+    from benchmarks.fake_aws import FakeCostExplorer
+    from utils.cost_explorer import COST_DB, CostExplorer, CostStore
+    explorer = CostExplorer(CostStore(COST_DB), pool)
+    end = datetime.datetime.now(datetime.timezone.utc).date()
+    start = end - datetime.timedelta(days=COST_DAYS)
+    rows = await explorer.get_daily_costs(start, end, group_by='SERVICE')
+    expected = COST_DAYS * len((await pool.get('ce', 'us-east-1')).services)
+    if len(rows) != expected:
+        return {'Error': f"stored {len(rows)} of {expected} daily service costs"}
+    for row in rows:
+        if abs(row['amount'] - FakeCostExplorer.amount(row['date'], row['key'])) > 1e-9:
+            return {'Error': f"{row['key']} on {row['date']} stored as {row['amount']}"}
+    return {'rows': len(rows), 'monthly_cost': sum(row['amount'] for row in rows)}
+
+
+async def _scenario(name: str, size: int, latency: float, lookback_days: int, reports_dir: Path) -> dict:
+    from benchmarks.fake_aws import FakePool
+    from Optimizers.runner import refresh_regions
+    from utils.rate_limiter import RateLimiterRegistry
+    limiter = RateLimiterRegistry()
+    pool = FakePool(size, latency, limiter)
+    ec2_options = {'cpu_threshold': 5.0, 'lookback_days': lookback_days, 'include_network': False, 'include_disk': False}
+    runs = {
+        # the body of POST /optimizer/refresh, without the HTTP layer
+        'refresh': lambda: refresh_regions([REGION], ec2_options=ec2_options, pool=pool),
+        'refresh_warm': lambda: refresh_regions([REGION], ec2_options=ec2_options, pool=pool),
+        'costs': lambda: _costs(pool),
+    }
+    if name == 'refresh_warm':
+        # first pass fills the metric, price and delta caches; only the second one is measured
+        await runs[name]()
+        pool.calls.clear()
+    started = time.perf_counter()
+    first_finding = None
+    if name in SCANS:
+        # single checkers run through their scan generator, the list_* wrappers only drain it
+        module, function = SCANS[name]
+        scan = getattr(importlib.import_module(f"Optimizers.{module}"), function)
+        body = {}
+        async for event, data in scan(REGION, pool=pool, **(ec2_options if name == 'ec2' else {})):
+            if event == 'finding' and first_finding is None:
+                first_finding = time.perf_counter() - started
+            elif event == 'done':
+                body = data
+    else:
+        response = await runs[name]()
+        body = response if isinstance(response, dict) else json.loads(response.body)
+    wall = time.perf_counter() - started
+    if 'Error' in body or body.get('failed'):
+        raise RuntimeError(f"{name} failed: {body}")
+    if body.get('rows') and not body.get('monthly_cost'):
+        # every fleet has priced findings, $0 means the seeded offline prices were never matched
+        raise RuntimeError(f"{name} priced {body['rows']} findings at $0: {body}")
+    return {
+        'scenario': name,
+        'size': size,
+        'wall_seconds': round(wall, 3),
+        # what a /optimizer/{checker}/stream client waits for before the first row shows up
+        'first_finding_seconds': round(first_finding, 3) if first_finding is not None else None,
+        'aws_calls': dict(sorted(pool.calls.items())),
+        'aws_calls_total': sum(pool.calls.values()),
+        'throttles': sum(s['throttles'] for s in limiter.stats()),
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != 'darwin' else 1024 ** 2), 1),
+        'report_bytes': sum(p.stat().st_size for p in reports_dir.iterdir() if p.is_file() and not p.name.startswith('.')),
+    }
+
+
+def _child(args) -> None:
+    # one scenario per process: caches start cold and peak RSS belongs to this scenario only
+    sys.path.insert(0, str(ROOT))
+    os.chdir(ROOT)
+    from utils.offline_pricing import OFFLINE_PRICING_DB
+    _seed_prices(OFFLINE_PRICING_DB)
+    result = asyncio.run(_scenario(args.scenario, args.size, args.latency, args.lookback_days, Path(os.environ['REPORTS_DIR'])))
+    print(json.dumps(result))
+
+
+def _run_child(scenario: str, size: int, latency: float, lookback_days: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix='optimizer-bench-') as tmp:
+        tmp = Path(tmp)
+        env = {
+            **os.environ,
+            'REPORTS_DIR': str(tmp / 'reports'),
+            'PRICE_CACHE_DB': str(tmp / 'pricing.sqlite'),
+            'OFFLINE_PRICING_DB': str(tmp / 'offline_pricing.sqlite'),
+            'OFFLINE_PRICING_ONLY': 'true',
+            'METRIC_CACHE_DIR': str(tmp / 'metrics'),
+            'DELTA_STATE_DIR': str(tmp / 'state'),
+            'COST_CACHE_DB': str(tmp / 'cost.sqlite'),
+            'HISTORY_DB': str(tmp / 'history.sqlite'),
+            'LOG_LEVEL': 'WARNING',
+        }
+        (tmp / 'reports').mkdir()
+        cmd = [sys.executable, '-m', 'benchmarks.run', '--child', '--scenario', scenario, '--size', str(size),
+               '--latency', str(latency), '--lookback-days', str(lookback_days)]
+        proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{scenario} @ {size} failed:\n{proc.stderr}")
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the checkers against an in-process AWS stand-in")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="instances / volumes / EIPs per fleet")
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds added to every AWS call")
+    parser.add_argument('--lookback-days', type=int, default=1, help="CloudWatch window of the EC2 checker")
+    parser.add_argument('--output', type=Path, help="JSON file to write, default benchmarks/results/<time>-<commit>.json")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args)
+        return
+    commit = _commit()
+    results = []
+    for size in args.sizes:
+        for scenario in args.scenarios:
+            result = _run_child(scenario, size, args.latency, args.lookback_days)
+            results.append(result)
+            first = f"{result['first_finding_seconds']:.2f}s" if result.get('first_finding_seconds') is not None else '-'
+            print(f"{scenario:>12} {size:>6}: {result['wall_seconds']:>8.2f}s (first finding {first:>6}) {result['aws_calls_total']:>6} calls "
+                  f"{result['peak_rss_mb']:>8.1f} MB {result['report_bytes']:>10} report bytes")
+    output = args.output or RESULTS_DIR / f"{time.strftime('%Y%m%dT%H%M%S')}-{commit or 'nogit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        'commit': commit,
+        'python': platform.python_version(),
+        'latency': args.latency,
+        'lookback_days': args.lookback_days,
+        'results': results,
+    }, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
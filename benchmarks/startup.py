@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from benchmarks.run import RESULTS_DIR, ROOT, _commit
+
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+FIRST_RESPONSE_TIMEOUT = 30.0  # seconds
+
+
+def import_profile() -> dict:
+    # `python -X importtime` prints self / cumulative microseconds of every module on stderr
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=ROOT, capture_output=True, text=True,
+                          env={**os.environ, 'LOG_LEVEL': 'WARNING'})
+    if proc.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{proc.stderr}")
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us), len(indent)))
+    end = next(i for i, (name, _, _, depth) in enumerate(modules) if name == 'main' and depth == 1)
+    # children are printed before their parent: main's direct imports are the depth-3 lines since the previous top-level one
+    start = max((i for i, m in enumerate(modules[:end]) if m[3] == 1), default=-1) + 1
+    total = modules[end][2]
+    direct = sorted(((name, cumulative) for name, _, cumulative, depth in modules[start:end] if depth == 3), key=lambda m: -m[1])
+    return {
+        'import_main_ms': round(total / 1000, 1),
+        'modules': len(modules),
+        'direct_imports_ms': {name: round(cumulative / 1000, 1) for name, cumulative in direct[:15]},
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def first_response(path: str) -> float:
+    # process start to the first 200 of `path`, what a scale-to-zero container's first caller waits for
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+                              cwd=ROOT, env={**os.environ, 'LOG_LEVEL': 'WARNING'}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < FIRST_RESPONSE_TIMEOUT:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                if server.poll() is not None:
+                    raise RuntimeError(f"server exited with {server.returncode}")
+            time.sleep(0.005)
+        raise RuntimeError(f"no response from {path} within {FIRST_RESPONSE_TIMEOUT}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure cold start: import time of main and time to the first response")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/all-reports', help="endpoint polled until it answers")
+    parser.add_argument('--output', help="JSON file to write, default benchmarks/results/startup-<time>-<commit>.json")
+    args = parser.parse_args()
+    commit = _commit()
+    profiles = [import_profile() for _ in range(args.runs)]
+    responses = [first_response(args.path) for _ in range(args.runs)]
+    best = min(profiles, key=lambda p: p['import_main_ms'])
+    result = {
+        'commit': commit,
+        'python': platform.python_version(),
+        'runs': args.runs,
+        'import_main_ms': statistics.median(p['import_main_ms'] for p in profiles),
+        'first_response_ms': round(statistics.median(responses) * 1000, 1),
+        'first_response_path': args.path,
+        'direct_imports_ms': best['direct_imports_ms'],  # from the fastest run, the least noisy one
+    }
+    print(f"import main: {result['import_main_ms']:.1f} ms, first {args.path} response: {result['first_response_ms']:.1f} ms "
+          f"(median of {args.runs})")
+    for name, ms in result['direct_imports_ms'].items():
+        print(f"  {name:<30} {ms:>8.1f} ms")
+    output = args.output or RESULTS_DIR / f"startup-{time.strftime('%Y%m%dT%H%M%S')}-{commit or 'nogit'}.json"
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
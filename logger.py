@@ -1,19 +1,209 @@
+import atexit
+import json
 import logging
-import os 
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 
 LOG_DIR = os.path.join(os.path.dirname(__file__), "logs")
-os.makedirs(LOG_DIR, exist_ok=True)
 LOG_FILE = os.path.join(LOG_DIR, "optimizer.log")
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # 'text' lines as before, or 'json' with one object per record
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s %(message)s"
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUPS = int(os.getenv('LOG_BACKUPS', 5))
+LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 20))  # INFO/DEBUG records per call site per window, the rest are counted and dropped
+LOG_RATE_WINDOW = 10.0  # seconds
+# the AWS SDKs are very chatty below WARNING; override with e.g. LOG_LEVELS="botocore=DEBUG"
+LOGGER_LEVELS = {
+    'botocore': 'WARNING',
+    'aiobotocore': 'WARNING',
+    'boto3': 'WARNING',
+    'urllib3': 'WARNING',
+    'asyncio': 'WARNING',
+    'aws-cost-optimizer': LOG_LEVEL,
+}
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s [%(levelname)s] %(name)s %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-    ]
-)
+log_context: ContextVar[dict] = ContextVar('log_context', default={})
 
 
+@contextmanager
+def bind_log_context(**fields):
+    # scan_id / region / checker attached to every record logged inside the block, including in child tasks
+    token = log_context.set({**log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        log_context.reset(token)
 
-logger = logging.getLogger('aws-cost-optimizer')
\ No newline at end of file
+
+class ContextFilter(logging.Filter):
+    # runs in the logging thread, before the record is handed to the queue
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in log_context.get().items():
+            setattr(record, key, value)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    # keeps hot loops from flooding the log: each call site may emit LOG_RATE_LIMIT INFO/DEBUG records per window,
+    # the rest are counted and every window that dropped any ends with one "N records suppressed" line for that site
+    def __init__(self, handler: logging.Handler, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW):
+        super().__init__()
+        self.handler = handler
+        self.limit = limit
+        self.window = window
+        self._sites: dict[tuple[str, int], list] = {}  # (path, line) -> [window start, emitted, suppressed, logger name]
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _expired(self, now: float, force: bool = False) -> list[logging.LogRecord]:
+        # called with the lock held; closes the windows that are over and returns their summary records
+        summaries = []
+        for (path, line), site in list(self._sites.items()):
+            if not force and now - site[0] < self.window:
+                continue
+            if site[2]:
+                summary = logging.LogRecord(site[3], logging.INFO, path, line, "%d records from %s:%d suppressed in the last %.0fs",
+                                            (site[2], os.path.basename(path), line, now - site[0]), None)
+                summary.suppressed = site[2]
+                summaries.append(summary)
+            del self._sites[(path, line)]
+        self._swept_at = now
+        return summaries
+
+    def flush(self) -> None:
+        with self._lock:
+            summaries = self._expired(time.monotonic(), force=True)
+        for summary in summaries:
+            self.handler.handle(summary)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or hasattr(record, 'suppressed'):
+            return True
+        now = time.monotonic()
+        summaries = []
+        with self._lock:
+            if now - self._swept_at >= self.window:
+                summaries = self._expired(now)
+            site = self._sites.setdefault((record.pathname, record.lineno), [now, 0, 0, record.name])
+            passed = site[1] < self.limit
+            site[1 if passed else 2] += 1
+        # the summaries are handed on outside the lock, they pass this filter again
+        for summary in summaries:
+            self.handler.handle(summary)
+        return passed
+
+
+class LazyRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    # the log directory and file are created by the first record, importing the app has no side effects on disk
+    def __init__(self, filename: str, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class TextFormatter(logging.Formatter):
+    # the original line format, with the log context appended as key=value pairs
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = ' '.join(f"{field}={getattr(record, field)}" for field in JsonFormatter.FIELDS
+                          if getattr(record, field, None) is not None and field != 'suppressed')
+        return f"{line} [{fields}]" if fields else line
+
+
+class JsonFormatter(logging.Formatter):
+    FIELDS = ('scan_id', 'account', 'region', 'checker', 'suppressed')
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _route_to(log_queue) -> None:
+    global _rate_limit
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    _rate_limit = RateLimitFilter(queue_handler)
+    queue_handler.addFilter(_rate_limit)
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(logging.DEBUG)
+    levels = dict(LOGGER_LEVELS)
+    for item in filter(None, os.getenv('LOG_LEVELS', '').split(',')):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+# nothing is configured at import: main.lifeSpan (or a CLI entry point) calls start_logging and stop_logging
+_file_handler = LazyRotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8')
+_file_handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+_listener: logging.handlers.QueueListener | None = None
+_rate_limit: RateLimitFilter | None = None
+
+
+def start_logging() -> None:
+    # the event loop only enqueues records; formatting and file I/O happen on the listener thread
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    _route_to(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, _file_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    # reports what the rate limit still holds back, then drains the queue so nothing logged before shutdown is lost
+    global _listener
+    if _rate_limit is not None:
+        _rate_limit.flush()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+@contextmanager
+def forward_worker_logs(log_queue):
+    # parent side of a process pool: the workers' records arrive on log_queue (a multiprocessing queue)
+    # and are written by this process's file handler, the only one that ever opens or rotates the log file
+    listener = logging.handlers.QueueListener(log_queue, _file_handler, respect_handler_level=True)
+    listener.start()
+    try:
+        yield
+    finally:
+        listener.stop()
+
+
+def configure_worker_logging(log_queue) -> None:
+    # worker side, called from the pool initializer: no file handler of its own, records go to the parent
+    _route_to(log_queue)
+
+
+logger = logging.getLogger('aws-cost-optimizer')
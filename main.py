@@ -1,18 +1,27 @@
 
+from dotenv import load_dotenv
+load_dotenv('.env')  # before any module reads its settings from the environment
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from logger import start_logging, stop_logging
 from Controllers.get import get_router
 from Controllers.optimizer import optimizer_router
+from utils.client_pool import client_pool
+from utils.jobs import job_scheduler
 
 
-asynccontextmanager
+@asynccontextmanager
 async def lifeSpan(app: FastAPI):
+    start_logging()
     print(f"Welcome to AWS Cost Optimizer")
     yield
+    await job_scheduler.shutdown()
+    await client_pool.close()
+    stop_logging()
 
 
-app = FastAPI(title="AWS Cost Optimizer")
+app = FastAPI(title="AWS Cost Optimizer", lifespan=lifeSpan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,22 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+
+# set while a multi-account scan runs a member account, so its reports and caches don't collide with other accounts'
+current_account: ContextVar[str | None] = ContextVar('current_account', default=None)
+
+
+@contextmanager
+def account_scope(account_id: str | None):
+    token = current_account.set(account_id)
+    try:
+        yield
+    finally:
+        current_account.reset(token)
+
+
+def scoped_dir(root: Path) -> Path:
+    # reports/ -> reports/accounts/<account id>/ inside an account scope
+    account_id = current_account.get()
+    return root / 'accounts' / account_id if account_id else root
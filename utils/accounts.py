@@ -0,0 +1,126 @@
+import asyncio
+import datetime
+import functools
+import os
+import re
+from dataclasses import dataclass
+from botocore.exceptions import ClientError
+from logger import logger
+from utils.client_pool import ClientPool, client_pool
+
+
+ACCOUNT_ROLE_NAME = os.getenv('ACCOUNT_ROLE_NAME', 'OrganizationAccountAccessRole')  # role assumed in every member account
+ACCOUNT_SESSION_SECONDS = int(os.getenv('ACCOUNT_SESSION_SECONDS', 3600))
+# credentials closer than this to expiry are assumed again; botocore starts refreshing 15 minutes before expiry
+CREDENTIAL_REFRESH_MARGIN = int(os.getenv('CREDENTIAL_REFRESH_MARGIN', 20 * 60))
+ROLE_SESSION_NAME = 'aws-cost-optimizer'
+ROLE_ARN_PATTERN = re.compile(r'^arn:aws[\w-]*:iam::(\d{12}):role/.+$')
+
+
+@dataclass(frozen=True)
+class Account:
+    account_id: str
+    role_arn: str | None  # None -> the account the optimizer's own credentials belong to
+    name: str | None = None
+
+
+def parse_accounts(entries: list[str], role_name: str = ACCOUNT_ROLE_NAME) -> list[Account]:
+    # each entry is a 12-digit account id (the role name is added) or a full role ARN
+    accounts = {}
+    for entry in entries:
+        entry = entry.strip()
+        match = ROLE_ARN_PATTERN.match(entry)
+        if match:
+            accounts[match.group(1)] = Account(match.group(1), entry)
+        elif re.fullmatch(r'\d{12}', entry):
+            accounts[entry] = Account(entry, f"arn:aws:iam::{entry}:role/{role_name}")
+        else:
+            raise ValueError(f"Not an account id or role ARN: {entry}")
+    return list(accounts.values())
+
+
+async def get_caller_account(pool: ClientPool = client_pool) -> str:
+    sts = await pool.get('sts', 'us-east-1')
+    return (await sts.get_caller_identity())['Account']
+
+
+async def list_organization_accounts(role_name: str = ACCOUNT_ROLE_NAME, pool: ClientPool = client_pool) -> list[Account]:
+    try:
+        org = await pool.get('organizations', 'us-east-1')
+        caller = await get_caller_account(pool)
+        accounts = []
+        async for page in org.get_paginator('list_accounts').paginate():
+            for acc in page['Accounts']:
+                if acc.get('Status') != 'ACTIVE':
+                    continue  # suspended / pending closure accounts can't be scanned
+                role_arn = None if acc['Id'] == caller else f"arn:aws:iam::{acc['Id']}:role/{role_name}"
+                accounts.append(Account(acc['Id'], role_arn, acc.get('Name')))
+        logger.info(f"accounts.list_organization_accounts() Method: ✅ {len(accounts)} active accounts in the organization")
+        return accounts
+    except ClientError as err:
+        logger.error(f"Error in accounts.list_organization_accounts() Method: ❌ AWS ClientError: {err}")
+        raise
+
+
+class CredentialCache:
+    # One set of AssumeRole credentials per account, shared by every scan of that account and
+    # assumed again CREDENTIAL_REFRESH_MARGIN seconds before they expire instead of after a failed call.
+    def __init__(self, pool: ClientPool = client_pool, refresh_margin: int = CREDENTIAL_REFRESH_MARGIN,
+                 duration: int = ACCOUNT_SESSION_SECONDS):
+        self.pool = pool
+        self.refresh_margin = refresh_margin
+        self.duration = duration
+        self._credentials: dict[str, dict] = {}  # role ARN -> botocore credential metadata
+        self._locks: dict[str, asyncio.Lock] = {}
+        self.stats = {'hits': 0, 'assumed': 0}
+
+    def _fresh(self, metadata: dict | None) -> bool:
+        if metadata is None:
+            return False
+        expiry = datetime.datetime.fromisoformat(metadata['expiry_time'])
+        return (expiry - datetime.datetime.now(datetime.timezone.utc)).total_seconds() > self.refresh_margin
+
+    def seed(self, role_arn: str, metadata: dict) -> None:
+        # credentials assumed by another process, e.g. the parent of a scan worker
+        self._credentials[role_arn] = metadata
+
+    async def _assume(self, role_arn: str) -> dict:
+        sts = await self.pool.get('sts', 'us-east-1')
+        resp = await sts.assume_role(RoleArn=role_arn, RoleSessionName=ROLE_SESSION_NAME, DurationSeconds=self.duration)
+        creds = resp['Credentials']
+        self.stats['assumed'] += 1
+        return {
+            'access_key': creds['AccessKeyId'],
+            'secret_key': creds['SecretAccessKey'],
+            'token': creds['SessionToken'],
+            'expiry_time': creds['Expiration'].astimezone(datetime.timezone.utc).isoformat(),
+        }
+
+    async def get(self, role_arn: str) -> dict:
+        metadata = self._credentials.get(role_arn)
+        if self._fresh(metadata):
+            self.stats['hits'] += 1
+            return metadata
+        async with self._locks.setdefault(role_arn, asyncio.Lock()):
+            # a concurrent caller may have assumed the role while we waited
+            if not self._fresh(self._credentials.get(role_arn)):
+                try:
+                    self._credentials[role_arn] = await self._assume(role_arn)
+                    logger.info(f"CredentialCache.get() Method: ✅ Assumed {role_arn}")
+                except ClientError as err:
+                    logger.error(f"Error in CredentialCache.get() Method: ❌ AssumeRole {role_arn} failed: {err}")
+                    raise
+            return self._credentials[role_arn]
+
+    def refreshable(self, role_arn: str):
+        # botocore calls back into the cache when the credentials are about to expire
+        from aiobotocore.credentials import AioRefreshableCredentials
+        return AioRefreshableCredentials.create_from_metadata(
+            self._credentials[role_arn], refresh_using=functools.partial(self.get, role_arn), method='assume-role')
+
+
+credential_cache = CredentialCache()
+
+
+def get_credential_cache() -> CredentialCache:
+    return credential_cache
@@ -0,0 +1,75 @@
+import asyncio
+import os
+from contextlib import AsyncExitStack
+from logger import logger
+from utils.jobs import count_api_call
+from utils.instrumentation import record_response_bytes
+from utils.rate_limiter import RateLimiterRegistry, rate_limiter
+
+
+PROFILE_NAME = os.getenv('AWS_PROFILE')  # main.py loads .env before anything reads the environment
+MAX_POOL_CONNECTIONS = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', 50))
+
+
+class ClientPool:
+    def __init__(self, max_pool_connections: int = MAX_POOL_CONNECTIONS, profile: str | None = PROFILE_NAME,
+                 limiter: RateLimiterRegistry = rate_limiter, credentials=None):
+        self.max_pool_connections = max_pool_connections
+        self.profile = profile
+        self.credentials = credentials  # assumed-role credentials of a member account, refreshed by botocore before they expire
+        self.limiter = limiter
+        self._sessions: dict[str | None, object] = {}  # profile -> aioboto3.Session
+        self._clients: dict[tuple[str, str, str | None], object] = {}
+        self._locks: dict[tuple[str, str, str | None], asyncio.Lock] = {}
+        self._stack = AsyncExitStack()
+
+    def _session(self, profile: str | None):
+        if profile not in self._sessions:
+            # aioboto3 pulls in aiohttp and the botocore data loaders, so it is imported by the first client, not at startup
+            import aioboto3
+            from aiobotocore.session import get_session
+            if self.credentials is not None:
+                botocore_session = get_session()
+                botocore_session._credentials = self.credentials
+                self._sessions[profile] = aioboto3.Session(botocore_session=botocore_session)
+            else:
+                self._sessions[profile] = aioboto3.Session(profile_name=profile)
+        return self._sessions[profile]
+
+    async def get(self, service: str, region: str, profile: str | None = None):
+        key = (service, region, profile or self.profile)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # another request may have created it while we waited on the lock
+            if key not in self._clients:
+                from botocore.config import Config
+                # botocore's own retries are off: throttles and transient errors are retried by the rate limiter, which
+                # also backs off on them (AdaptiveLimiter.call for calls, its needs-retry hook for paginator pages)
+                config = Config(max_pool_connections=self.max_pool_connections, retries={'mode': 'standard', 'total_max_attempts': 1})
+                client = await self._stack.enter_async_context(
+                    self._session(key[2]).client(service, region_name=region, config=config)
+                )
+                client.meta.events.register('before-parameter-build', count_api_call)
+                client.meta.events.register('after-call', record_response_bytes)
+                self._clients[key] = self.limiter.wrap(client, service, region)
+                logger.info(f"ClientPool.get() Method: ✅ Created {service} client for region {region}")
+        return self._clients[key]
+
+    async def close(self) -> None:
+        try:
+            await self._stack.aclose()
+        finally:
+            self._clients.clear()
+            self._locks.clear()
+            self._stack = AsyncExitStack()
+        logger.info("ClientPool.close() Method: ✅ All AWS clients closed")
+
+
+client_pool = ClientPool()
+
+
+def get_client_pool() -> ClientPool:
+    return client_pool
@@ -0,0 +1,59 @@
+from datetime import datetime
+from logger import logger
+from botocore.exceptions import ClientError
+
+
+MAX_QUERIES_PER_CALL = 500  # GetMetricData hard limit on MetricDataQueries
+
+
+def chunked(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def get_metric_data_batched(cw, instance_ids: list[str], metric_name: str, start_time: datetime, end_time: datetime,
+                                  period: int = 3600, stat: str = 'Average', namespace: str = 'AWS/EC2') -> dict[str, list[tuple[datetime, float]]]:
+    try:
+        series = {instance_id: [] for instance_id in instance_ids}
+        for batch in chunked(instance_ids, MAX_QUERIES_PER_CALL):
+            # Query ids must start with a lowercase letter, so map them back by position
+            query_ids = {f"m{i}": instance_id for i, instance_id in enumerate(batch)}
+            queries = [
+                {
+                    'Id': query_id,
+                    'MetricStat': {
+                        'Metric': {
+                            'Namespace': namespace,
+                            'MetricName': metric_name,
+                            'Dimensions': [{'Name': 'InstanceId', 'Value': instance_id}],
+                        },
+                        'Period': period,
+                        'Stat': stat,
+                    },
+                    'ReturnData': True,
+                }
+                for query_id, instance_id in query_ids.items()
+            ]
+            kwargs = {
+                'MetricDataQueries': queries,
+                'StartTime': start_time,
+                'EndTime': end_time,
+                'ScanBy': 'TimestampAscending',
+            }
+            while True:
+                resp = await cw.get_metric_data(**kwargs)
+                for result in resp.get('MetricDataResults', []):
+                    instance_id = query_ids[result['Id']]
+                    series[instance_id].extend(zip(result.get('Timestamps', []), result.get('Values', [])))
+                next_token = resp.get('NextToken')
+                if not next_token:
+                    break
+                kwargs['NextToken'] = next_token
+        logger.info(f"cloudwatch.get_metric_data_batched() Method: ✅ Fetched {metric_name} for {len(instance_ids)} instances")
+        return series
+    except ClientError as err:
+        logger.error(f"Error in cloudwatch.get_metric_data_batched() Method: ❌ AWS ClientError: {err}")
+        raise
+    except Exception as err:
+        logger.error(f"Error in cloudwatch.get_metric_data_batched() Method: ❌ Unexpected error: {err}")
+        raise
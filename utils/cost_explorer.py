@@ -0,0 +1,162 @@
+import asyncio
+import datetime
+import os
+import sqlite3
+import time
+from pathlib import Path
+from botocore.exceptions import ClientError
+from logger import logger
+from utils.client_pool import ClientPool, client_pool
+
+
+COST_DB = Path(os.getenv('COST_CACHE_DB', 'cache/cost.sqlite'))
+COST_SETTLE_REFRESH = int(os.getenv('COST_SETTLE_REFRESH', 6 * 3600))  # seconds before an estimated day is fetched again
+COST_METRIC = 'UnblendedCost'
+GROUP_BY_DIMENSIONS = {'REGION', 'SERVICE'}
+TOTAL = 'TOTAL'  # dimension name used for ungrouped daily totals
+
+
+class CostStore:
+    def __init__(self, path: Path):
+        self.path = path
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS daily_cost (
+                    date TEXT NOT NULL, dimension TEXT NOT NULL, key TEXT NOT NULL,
+                    amount REAL NOT NULL, unit TEXT NOT NULL,
+                    PRIMARY KEY (dimension, date, key)
+                );
+                CREATE TABLE IF NOT EXISTS fetched_days (
+                    date TEXT NOT NULL, dimension TEXT NOT NULL,
+                    estimated INTEGER NOT NULL, fetched_at REAL NOT NULL,
+                    PRIMARY KEY (dimension, date)
+                );
+            """)
+        return self._conn
+
+    def stale_days(self, dimension: str, days: list[str]) -> list[str]:
+        # a day is fetched again only if it was never fetched, or AWS still marked it as estimated
+        rows = self._connect().execute(
+            "SELECT date, estimated, fetched_at FROM fetched_days WHERE dimension = ? AND date BETWEEN ? AND ?",
+            (dimension, days[0], days[-1]),
+        ).fetchall()
+        settled = {date for date, estimated, fetched_at in rows if not estimated or time.time() - fetched_at < COST_SETTLE_REFRESH}
+        return [day for day in days if day not in settled]
+
+    def save(self, dimension: str, results: list[dict]) -> None:
+        # grouped responses page through groups, not days: one day's groups can span two pages and
+        # show up as two items with the same TimePeriod, so merge them before replacing the day
+        days: dict[str, dict] = {}
+        for item in results:
+            day = days.setdefault(item['TimePeriod']['Start'], {'groups': {}, 'estimated': False})
+            day['estimated'] = day['estimated'] or item.get('Estimated', False)
+            if dimension == TOTAL:
+                groups = [(TOTAL, item['Total'][COST_METRIC])]
+            else:
+                groups = [(g['Keys'][0], g['Metrics'][COST_METRIC]) for g in item.get('Groups', [])]
+            for key, metric in groups:
+                amount, _ = day['groups'].get(key, (0.0, None))
+                day['groups'][key] = (amount + float(metric['Amount']), metric['Unit'])
+        conn = self._connect()
+        with conn:
+            for date, day in days.items():
+                conn.execute("DELETE FROM daily_cost WHERE dimension = ? AND date = ?", (dimension, date))
+                conn.executemany(
+                    "INSERT INTO daily_cost (date, dimension, key, amount, unit) VALUES (?, ?, ?, ?, ?)",
+                    [(date, dimension, key, amount, unit) for key, (amount, unit) in day['groups'].items()],
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO fetched_days (date, dimension, estimated, fetched_at) VALUES (?, ?, ?, ?)",
+                    (date, dimension, int(day['estimated']), time.time()),
+                )
+
+    def query(self, dimension: str, start: str, end: str, key: str | None = None) -> list[dict]:
+        sql = "SELECT date, key, amount, unit FROM daily_cost WHERE dimension = ? AND date >= ? AND date < ?"
+        params = [dimension, start, end]
+        if key:
+            sql += " AND key = ?"
+            params.append(key)
+        rows = self._connect().execute(sql + " ORDER BY date, key", params).fetchall()
+        return [{'date': date, 'key': k, 'amount': amount, 'currency': unit} for date, k, amount, unit in rows]
+
+
+def _days(start: datetime.date, end: datetime.date) -> list[str]:
+    return [(start + datetime.timedelta(days=i)).isoformat() for i in range((end - start).days)]
+
+
+def _ranges(days: list[str]) -> list[tuple[str, str]]:
+    # collapse missing days into contiguous [start, end) ranges, one Cost Explorer query each
+    ranges = []
+    for day in days:
+        next_day = (datetime.date.fromisoformat(day) + datetime.timedelta(days=1)).isoformat()
+        if ranges and ranges[-1][1] == day:
+            ranges[-1] = (ranges[-1][0], next_day)
+        else:
+            ranges.append((day, next_day))
+    return ranges
+
+
+class CostExplorer:
+    def __init__(self, store: CostStore, pool: ClientPool = client_pool):
+        self.store = store
+        self.pool = pool
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._db_lock = asyncio.Lock()
+
+    async def _fetch(self, dimension: str, start: str, end: str) -> list[dict]:
+        ce = await self.pool.get('ce', 'us-east-1')
+        kwargs = {
+            'TimePeriod': {'Start': start, 'End': end},
+            'Granularity': 'DAILY',
+            'Metrics': [COST_METRIC],
+        }
+        if dimension != TOTAL:
+            kwargs['GroupBy'] = [{'Type': 'DIMENSION', 'Key': dimension}]
+        results = []
+        while True:
+            resp = await ce.get_cost_and_usage(**kwargs)
+            results.extend(resp['ResultsByTime'])
+            token = resp.get('NextPageToken')
+            if not token:
+                return results
+            kwargs['NextPageToken'] = token
+
+    async def get_daily_costs(self, start: datetime.date, end: datetime.date, group_by: str | None = None, key: str | None = None) -> list[dict]:
+        try:
+            dimension = group_by.upper() if group_by else TOTAL
+            if dimension != TOTAL and dimension not in GROUP_BY_DIMENSIONS:
+                raise ValueError(f"group_by must be one of {', '.join(sorted(GROUP_BY_DIMENSIONS))}")
+            end = min(end, datetime.datetime.now(datetime.timezone.utc).date() + datetime.timedelta(days=1))
+            days = _days(start, end)
+            if not days:
+                return []
+            # one fetch per dimension at a time, concurrent callers then find the days already stored
+            async with self._locks.setdefault(dimension, asyncio.Lock()):
+                async with self._db_lock:
+                    missing = await asyncio.to_thread(self.store.stale_days, dimension, days)
+                for range_start, range_end in _ranges(missing):
+                    results = await self._fetch(dimension, range_start, range_end)
+                    async with self._db_lock:
+                        await asyncio.to_thread(self.store.save, dimension, results)
+                if missing:
+                    logger.info(f"cost_explorer.get_daily_costs() Method: ✅ Fetched {len(missing)} days of {dimension} costs")
+            async with self._db_lock:
+                return await asyncio.to_thread(self.store.query, dimension, days[0], end.isoformat(), key)
+        except ClientError as err:
+            logger.error(f"Error in cost_explorer.get_daily_costs() Method: ❌ AWS ClientError: {err}")
+            raise
+        except Exception as err:
+            logger.error(f"Error in cost_explorer.get_daily_costs() Method: ❌ Unexpected error: {err}")
+            raise
+
+
+cost_explorer = CostExplorer(CostStore(COST_DB))
+
+
+def get_cost_explorer() -> CostExplorer:
+    return cost_explorer
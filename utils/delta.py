@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from logger import logger
+from utils.account_scope import scoped_dir
+
+
+DELTA_STATE_DIR = Path(os.getenv('DELTA_STATE_DIR', 'cache/state'))
+DELTA_FULL_SCAN_AFTER = int(os.getenv('DELTA_FULL_SCAN_AFTER', 7 * 24 * 3600))  # seconds before every resource is re-evaluated, picks up price changes
+
+
+def fingerprint(*fields) -> str:
+    return hashlib.blake2b(json.dumps(fields, default=str).encode(), digest_size=8).hexdigest()
+
+
+def diff_path(report: Path) -> Path:
+    # reports/unused_ebs_us-east-1.csv(.gz) -> reports/unused_ebs_us-east-1.diff.json
+    return report.with_name(report.name.split('.csv')[0] + '.diff.json')
+
+
+class DeltaScan:
+    # Remembers each resource's fingerprint and finding between two scans of one checker/region.
+    # Unchanged resources reuse their previous finding; a diff of the findings is written next to the report.
+    def __init__(self, checker: str, region: str, report: Path, compare: tuple[str, ...] | None = None, root: Path = DELTA_STATE_DIR):
+        self.checker = checker
+        self.compare = compare  # finding fields that count as a change, None -> the whole finding
+        self.region = region
+        self.path = scoped_dir(root) / f"{checker}_{region}.json"
+        self.diff_path = diff_path(report)
+        self.previous_scan_at: float | None = None
+        self.reused = 0
+        self.evaluated = 0
+        self._previous: dict[str, dict] = {}  # resource id -> {'fingerprint': ..., 'finding': ...}
+        self._current: dict[str, dict] = {}
+        self._carry_forward = False
+
+    def _load(self) -> None:
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as err:
+            logger.error(f"❌ Error in DeltaScan._load() Method: ignoring unreadable state {self.path}: {err}")
+            return
+        self.previous_scan_at = state.get('scanned_at')
+        self._previous = state.get('resources', {})
+        self._carry_forward = self.previous_scan_at is not None and time.time() - self.previous_scan_at < DELTA_FULL_SCAN_AFTER
+
+    async def __aenter__(self) -> 'DeltaScan':
+        await asyncio.to_thread(self._load)
+        return self
+
+    def lookup(self, resource_id: str, resource_fingerprint: str) -> tuple[bool, dict | None]:
+        # (True, finding) when the resource is unchanged since the last scan and its finding can be carried forward
+        entry = self._previous.get(resource_id)
+        if self._carry_forward and entry is not None and entry['fingerprint'] == resource_fingerprint:
+            self.reused += 1
+            self._current[resource_id] = entry
+            return True, entry['finding']
+        return False, None
+
+    def record(self, resource_id: str, resource_fingerprint: str, finding: dict | None) -> None:
+        self.evaluated += 1
+        self._current[resource_id] = {'fingerprint': resource_fingerprint, 'finding': finding}
+
+    def _changed(self, before: dict, after: dict) -> bool:
+        if self.compare is None:
+            return before != after
+        return any(before.get(k) != after.get(k) for k in self.compare)
+
+    def diff(self) -> dict:
+        before = {rid: e['finding'] for rid, e in self._previous.items() if e['finding'] is not None}
+        after = {rid: e['finding'] for rid, e in self._current.items() if e['finding'] is not None}
+        return {
+            'checker': self.checker,
+            'region': self.region,
+            'generated_at': time.time(),
+            'previous_scan_at': self.previous_scan_at,
+            'evaluated': self.evaluated,
+            'reused': self.reused,
+            'added': [after[rid] for rid in after.keys() - before.keys()],
+            'removed': [before[rid] for rid in before.keys() - after.keys()],
+            'changed': [{'before': before[rid], 'after': after[rid]} for rid in after.keys() & before.keys() if self._changed(before[rid], after[rid])],
+        }
+
+    def _write(self, path: Path, content: dict) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(content, f, default=str)
+        os.replace(tmp, path)
+
+    def _save(self) -> dict:
+        diff = self.diff()
+        self._write(self.diff_path, diff)
+        self._write(self.path, {'scanned_at': time.time(), 'resources': self._current})
+        return diff
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            return  # a failed scan keeps the previous state, the next one compares against it
+        diff = await asyncio.to_thread(self._save)
+        logger.info(f"DeltaScan() Method: ✅ {self.checker} {self.region}: {self.evaluated} evaluated, {self.reused} carried forward, "
+                    f"{len(diff['added'])} added, {len(diff['removed'])} removed, {len(diff['changed'])} changed")
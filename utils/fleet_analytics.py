@@ -0,0 +1,85 @@
+import os
+from dataclasses import dataclass
+import numpy as np
+
+
+# share of hours that must also be under the CPU threshold to call an instance idle; 0 keeps the original
+# average-only rule, 0.99 stops a daily batch spike from being averaged away
+IDLE_HOURS_FRACTION = float(os.getenv('IDLE_HOURS_FRACTION', 0.0))
+RIGHTSIZE_P95_THRESHOLD = float(os.getenv('RIGHTSIZE_P95_THRESHOLD', 40.0))  # % CPU, busier instances are left alone
+NETWORK_IDLE_BYTES = float(os.getenv('NETWORK_IDLE_BYTES', 5 * 1024 ** 2))  # in + out per hour at p95
+DISK_IDLE_BYTES = float(os.getenv('DISK_IDLE_BYTES', 5 * 1024 ** 2))  # read + write per hour at p95
+NETWORK_METRICS = ('NetworkIn', 'NetworkOut')
+DISK_METRICS = ('EBSReadBytes', 'EBSWriteBytes', 'DiskReadBytes', 'DiskWriteBytes')  # Nitro EBS and instance store
+
+IDLE = 'idle'
+RIGHTSIZE = 'rightsize'
+ACTIVE = 'active'
+NO_DATA = 'no_data'
+
+
+@dataclass(frozen=True, slots=True)
+class UtilizationStats:
+    # one entry per instance row of the matrix, NaN where the instance has no datapoints
+    mean: np.ndarray
+    p95: np.ndarray
+    max: np.ndarray
+    below_fraction: np.ndarray
+    samples: np.ndarray
+
+
+def combine(*matrices: np.ndarray) -> np.ndarray:
+    # element-wise sum that stays NaN only where every input is NaN
+    if len(matrices) == 1:
+        return matrices[0]
+    present = np.zeros(matrices[0].shape, dtype=bool)
+    total = np.zeros(matrices[0].shape)
+    for matrix in matrices:
+        valid = ~np.isnan(matrix)
+        present |= valid
+        total += np.where(valid, matrix, 0.0)
+    total[~present] = np.nan
+    return total
+
+
+def _percentile(matrix: np.ndarray, samples: np.ndarray, q: float) -> np.ndarray:
+    # np.nanpercentile falls back to a per-row loop; rows are grouped by sample count instead
+    # (usually one group), and np.partition moves NaNs to the end so the first `count` cells are the data
+    result = np.full(len(matrix), np.nan)
+    for count in np.unique(samples[samples > 0]):
+        rows = np.flatnonzero(samples == count)
+        position = (count - 1) * q / 100
+        low = int(position)
+        part = np.partition(matrix[rows], low, axis=1)
+        lower = part[:, low]
+        # everything right of `low` is larger, so the next order statistic is their minimum
+        upper = part[:, low + 1:count].min(axis=1) if low + 1 < count else lower
+        result[rows] = lower + (upper - lower) * (position - low)
+    return result
+
+
+def utilization_stats(matrix: np.ndarray, threshold: float | None = None) -> UtilizationStats:
+    valid = ~np.isnan(matrix)
+    samples = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = matrix.sum(axis=1, where=valid) / samples
+        below = (matrix < threshold).sum(axis=1) / samples if threshold is not None else np.full(len(matrix), np.nan)
+    peak = np.fmax.reduce(matrix, axis=1)  # ignores NaN, all-NaN rows stay NaN
+    return UtilizationStats(mean=mean, p95=_percentile(matrix, samples, 95), max=peak, below_fraction=below, samples=samples)
+
+
+def classify(cpu: UtilizationStats, cpu_threshold: float, network: UtilizationStats | None = None,
+             disk: UtilizationStats | None = None, idle_hours_fraction: float = IDLE_HOURS_FRACTION) -> np.ndarray:
+    # idle needs a low average and, if asked for, that share of hours under the threshold too
+    idle = (cpu.mean < cpu_threshold) & (cpu.below_fraction >= idle_hours_fraction)
+    # a missing secondary signal (NaN) does not veto the CPU verdict
+    if network is not None:
+        idle &= ~(network.p95 >= NETWORK_IDLE_BYTES)
+    if disk is not None:
+        idle &= ~(disk.p95 >= DISK_IDLE_BYTES)
+    rightsize = ~idle & (cpu.p95 < RIGHTSIZE_P95_THRESHOLD)
+    labels = np.full(len(cpu.mean), ACTIVE, dtype=object)
+    labels[rightsize] = RIGHTSIZE
+    labels[idle] = IDLE
+    labels[cpu.samples == 0] = NO_DATA
+    return labels
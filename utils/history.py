@@ -0,0 +1,183 @@
+import asyncio
+import datetime
+import os
+import sqlite3
+import time
+from pathlib import Path
+from logger import logger
+from utils.account_scope import current_account
+
+
+HISTORY_DB = Path(os.getenv('HISTORY_DB', 'cache/history.sqlite'))
+HISTORY_RAW_DAYS = int(os.getenv('HISTORY_RAW_DAYS', 14))  # scans and their findings kept individually
+HISTORY_DAILY_DAYS = int(os.getenv('HISTORY_DAILY_DAYS', 180))  # daily rollups older than this are merged into weekly ones
+HISTORY_COMPACT_EVERY = 3600  # seconds between two compactions, run after a scan is recorded
+GRANULARITIES = {
+    'day': "bucket",
+    'week': "date(bucket, '-6 days', 'weekday 1')",  # Monday of the bucket's week
+    'month': "strftime('%Y-%m-01', bucket)",
+}
+GROUP_BY_FIELDS = ('checker', 'region', 'account')
+
+
+def _day(ts: float) -> datetime.date:
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).date()
+
+
+def _period_start(day: datetime.date, granularity: str) -> datetime.date:
+    # same periods as GRANULARITIES: Monday of the week, first of the month
+    if granularity == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(day: datetime.date, granularity: str) -> datetime.date:
+    # start of the period after the one `day` falls in, unless `day` already starts one
+    start = _period_start(day, granularity)
+    if start == day:
+        return day
+    if granularity == 'week':
+        return start + datetime.timedelta(days=7)
+    return (start + datetime.timedelta(days=31)).replace(day=1)
+
+
+class HistoryStore:
+    # Every scan is kept for HISTORY_RAW_DAYS with its findings; what outlives it are the rollups, one row per
+    # checker/region/account and day (later week) with running sums, so trend queries never touch raw scans.
+    def __init__(self, path: Path):
+        self.path = path
+        self._conn = None
+        self.compacted_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # account scans write from several worker processes
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS scans (
+                    id INTEGER PRIMARY KEY, checker TEXT NOT NULL, region TEXT NOT NULL, account TEXT NOT NULL,
+                    scanned_at REAL NOT NULL, findings INTEGER NOT NULL, monthly_cost REAL NOT NULL, report TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS scans_by_time ON scans (scanned_at);
+                CREATE INDEX IF NOT EXISTS scans_by_checker ON scans (checker, region, scanned_at);
+                CREATE TABLE IF NOT EXISTS findings (
+                    scan_id INTEGER NOT NULL, resource_id TEXT NOT NULL, monthly_cost REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS findings_by_scan ON findings (scan_id);
+                CREATE TABLE IF NOT EXISTS rollups (
+                    granularity TEXT NOT NULL, bucket TEXT NOT NULL, checker TEXT NOT NULL, region TEXT NOT NULL, account TEXT NOT NULL,
+                    scans INTEGER NOT NULL, findings_sum INTEGER NOT NULL, cost_sum REAL NOT NULL, cost_max REAL NOT NULL,
+                    PRIMARY KEY (granularity, checker, region, account, bucket)
+                );
+                CREATE INDEX IF NOT EXISTS rollups_by_bucket ON rollups (bucket);
+            """)
+        return self._conn
+
+    def record(self, checker: str, region: str, account: str, report: str, findings: list[tuple[str, float]],
+               monthly_cost: float, scanned_at: float) -> int:
+        conn = self._connect()
+        with conn:
+            scan_id = conn.execute(
+                "INSERT INTO scans (checker, region, account, scanned_at, findings, monthly_cost, report) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (checker, region, account, scanned_at, len(findings), monthly_cost, report),
+            ).lastrowid
+            conn.executemany("INSERT INTO findings (scan_id, resource_id, monthly_cost) VALUES (?, ?, ?)",
+                             [(scan_id, resource_id, cost) for resource_id, cost in findings])
+            conn.execute("""
+                INSERT INTO rollups (granularity, bucket, checker, region, account, scans, findings_sum, cost_sum, cost_max)
+                VALUES ('day', ?, ?, ?, ?, 1, ?, ?, ?)
+                ON CONFLICT (granularity, checker, region, account, bucket) DO UPDATE SET
+                    scans = scans + 1, findings_sum = findings_sum + excluded.findings_sum,
+                    cost_sum = cost_sum + excluded.cost_sum, cost_max = max(cost_max, excluded.cost_max)
+            """, (_day(scanned_at).isoformat(), checker, region, account, len(findings), monthly_cost, monthly_cost))
+        return scan_id
+
+    def compact(self, now: float) -> dict:
+        conn = self._connect()
+        raw_cutoff = now - HISTORY_RAW_DAYS * 86400
+        # whole weeks only, so a week is never split between daily and weekly rows
+        daily_cutoff = _day(now) - datetime.timedelta(days=HISTORY_DAILY_DAYS)
+        daily_cutoff -= datetime.timedelta(days=daily_cutoff.weekday())
+        with conn:
+            findings = conn.execute("DELETE FROM findings WHERE scan_id IN (SELECT id FROM scans WHERE scanned_at < ?)", (raw_cutoff,)).rowcount
+            scans = conn.execute("DELETE FROM scans WHERE scanned_at < ?", (raw_cutoff,)).rowcount
+            conn.execute(f"""
+                INSERT INTO rollups (granularity, bucket, checker, region, account, scans, findings_sum, cost_sum, cost_max)
+                SELECT 'week', {GRANULARITIES['week']}, checker, region, account, SUM(scans), SUM(findings_sum), SUM(cost_sum), MAX(cost_max)
+                FROM rollups WHERE granularity = 'day' AND bucket < ?
+                GROUP BY 2, 3, 4, 5
+                ON CONFLICT (granularity, checker, region, account, bucket) DO UPDATE SET
+                    scans = scans + excluded.scans, findings_sum = findings_sum + excluded.findings_sum,
+                    cost_sum = cost_sum + excluded.cost_sum, cost_max = max(cost_max, excluded.cost_max)
+            """, (daily_cutoff.isoformat(),))
+            days = conn.execute("DELETE FROM rollups WHERE granularity = 'day' AND bucket < ?", (daily_cutoff.isoformat(),)).rowcount
+        self.compacted_at = now
+        return {'scans': scans, 'findings': findings, 'daily_rollups': days}
+
+    def waste(self, start: str, end: str, granularity: str, group_by: tuple[str, ...], checker: str | None,
+              region: str | None, account: str | None) -> list[dict]:
+        # average monthly cost of the findings per period: averaged over the period's scans of each
+        # checker/region/account, then summed over whatever is not grouped by
+        where, params = ["bucket >= ?", "bucket < ?"], [start, end]
+        for field, value in (('checker', checker), ('region', region), ('account', account)):
+            if value is not None:
+                where.append(f"{field} = ?")
+                params.append(value)
+        columns = ''.join(f", {field}" for field in group_by)
+        rows = self._connect().execute(f"""
+            SELECT period{columns}, SUM(waste), SUM(findings), SUM(scans) FROM (
+                SELECT {GRANULARITIES[granularity]} AS period, checker, region, account,
+                       SUM(cost_sum) / SUM(scans) AS waste, SUM(findings_sum) * 1.0 / SUM(scans) AS findings, SUM(scans) AS scans
+                FROM rollups WHERE {' AND '.join(where)}
+                GROUP BY period, checker, region, account
+            ) GROUP BY period{columns} ORDER BY period{columns}
+        """, params).fetchall()
+        return [
+            {'period': row[0], **dict(zip(group_by, row[1:-3])),
+             'monthly_waste': round(row[-3], 2), 'findings': round(row[-2], 1), 'scans': row[-1]}
+            for row in rows
+        ]
+
+
+class FindingsHistory:
+    def __init__(self, store: HistoryStore):
+        self.store = store
+        self._db_lock = asyncio.Lock()  # serializes sqlite access across worker threads
+
+    async def record_scan(self, checker: str, region: str, report: str, findings: list[tuple[str, float]],
+                          monthly_cost: float, scanned_at: float | None = None) -> None:
+        try:
+            scanned_at = scanned_at or time.time()
+            account = current_account.get() or ''
+            async with self._db_lock:
+                await asyncio.to_thread(self.store.record, checker, region, account, report, findings, monthly_cost, scanned_at)
+                if scanned_at - self.store.compacted_at > HISTORY_COMPACT_EVERY:
+                    removed = await asyncio.to_thread(self.store.compact, scanned_at)
+                    logger.info(f"history.record_scan() Method: ✅ Compacted history: {removed}")
+        except Exception as err:
+            # losing one history point must never fail the scan that produced the report
+            logger.error(f"Error in history.record_scan() Method: ❌ {checker} {region}: {err}")
+
+    async def waste(self, start: datetime.date, end: datetime.date, granularity: str = 'day', group_by: tuple[str, ...] = ('checker', 'region'),
+                    checker: str | None = None, region: str | None = None, account: str | None = None) -> list[dict]:
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        unknown = set(group_by) - set(GROUP_BY_FIELDS)
+        if unknown:
+            raise ValueError(f"group_by must be a subset of {', '.join(GROUP_BY_FIELDS)}")
+        # whole periods only, a week or month cut by start or end would be averaged over a few of its days
+        start, end = _period_start(start, granularity), _next_period(end, granularity)
+        async with self._db_lock:
+            return await asyncio.to_thread(self.store.waste, start.isoformat(), end.isoformat(), granularity,
+                                           tuple(f for f in GROUP_BY_FIELDS if f in group_by), checker, region, account)
+
+
+findings_history = FindingsHistory(HistoryStore(HISTORY_DB))
+
+
+def get_findings_history() -> FindingsHistory:
+    return findings_history
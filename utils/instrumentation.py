@@ -0,0 +1,134 @@
+import bisect
+from collections import defaultdict
+from typing import Callable, Iterable
+from logger import logger
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self.type = 'counter'
+        self._values: dict[tuple, float] = defaultdict(float)
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        self._values[label_values] += amount
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, labels
+        self.type = 'histogram'
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # labels -> [per-bucket counts..., sum, count]
+
+    def observe(self, *label_values, value: float) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = _labels(self.labels, label_values, 'le="%s"' % _number(bound))
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            inf_labels = _labels(self.labels, label_values, 'le="+Inf"')
+            yield f"{self.name}_bucket{inf_labels} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {series[-1]}"
+
+
+class Collected:
+    # values read from their owner at scrape time (cache stats, limiter state) instead of being pushed
+    def __init__(self, name: str, help: str, type: str, labels: tuple[str, ...], collect: Callable[[], Iterable[tuple[tuple, float]]]):
+        self.name, self.help, self.type, self.labels = name, help, type, labels
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in self.collect():
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram | Collected] = {}
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collected(self, name: str, help: str, type: str, labels: tuple[str, ...], collect: Callable) -> Collected:
+        return self._add(Collected(name, help, type, labels, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = list(metric.samples())
+            except Exception as err:
+                logger.error(f"❌ Error in MetricsRegistry.render() Method: skipping {metric.name}: {err}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+AWS_LABELS = ('service', 'operation', 'region')
+aws_calls = metrics.counter('aws_api_calls_total', 'AWS API call attempts', AWS_LABELS + ('outcome',))
+aws_latency = metrics.histogram('aws_api_call_duration_seconds', 'AWS API call attempt latency', AWS_LABELS)
+aws_retries = metrics.counter('aws_api_retries_total', 'AWS API calls retried after a throttle or transient error', AWS_LABELS)
+aws_throttles = metrics.counter('aws_api_throttles_total', 'AWS API calls rejected with a throttling error', AWS_LABELS)
+aws_bytes = metrics.counter('aws_api_response_bytes_total', 'Bytes received in AWS API responses', AWS_LABELS)
+phase_latency = metrics.histogram('optimizer_phase_duration_seconds', 'Time spent per checker phase', ('checker', 'phase'), PHASE_BUCKETS)
+scans = metrics.counter('optimizer_scans_total', 'Finished scan jobs', ('kind', 'status'))
+scan_latency = metrics.histogram('optimizer_scan_duration_seconds', 'Scan job wall time', ('kind',), PHASE_BUCKETS)
+
+
+def record_response_bytes(http_response=None, model=None, context=None, **kwargs) -> None:
+    # botocore 'after-call' handler
+    if http_response is None or model is None:
+        return
+    length = http_response.headers.get('content-length')
+    if length:
+        region = (context or {}).get('client_region', '')
+        aws_bytes.inc(model.service_model.service_name, model.name, region, amount=float(length))
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from botocore.exceptions import ClientError
+from logger import logger
+from utils.client_pool import ClientPool, client_pool
+
+
+INVENTORY_KINDS = ('instances', 'volumes', 'addresses', 'nat_gateways')
+
+
+@dataclass(frozen=True, slots=True)
+class InstanceRecord:
+    id: str
+    state: str
+    type: str
+    platform: str
+
+
+@dataclass(frozen=True, slots=True)
+class VolumeRecord:
+    id: str
+    size: int
+    type: str
+    attached: bool
+
+
+@dataclass(frozen=True, slots=True)
+class AddressRecord:
+    allocation_id: str
+    public_ip: str
+    instance_id: str
+    network_interface_id: str
+    domain: str
+
+
+@dataclass(frozen=True, slots=True)
+class NatGatewayRecord:
+    id: str
+    allocation_ids: tuple[str, ...]
+
+
+@dataclass(slots=True)
+class RegionInventory:
+    region: str
+    instances: dict[str, InstanceRecord] = field(default_factory=dict)
+    volumes: dict[str, VolumeRecord] = field(default_factory=dict)  # only volumes in `available` state
+    addresses: dict[str, AddressRecord] = field(default_factory=dict)
+    nat_gateways: dict[str, NatGatewayRecord] = field(default_factory=dict)
+    nat_by_allocation: dict[str, str] = field(default_factory=dict)
+    fetched_at: float = field(default_factory=time.time)
+
+    def running_instances(self) -> list[InstanceRecord]:
+        return [inst for inst in self.instances.values() if inst.state == 'running']
+
+
+async def _fetch_instances(ec2) -> dict[str, InstanceRecord]:
+    records = {}
+    paginator = ec2.get_paginator('describe_instances')
+    # terminated instances can't hold EIPs or accrue cost, so leave them out server-side
+    filters = [{'Name': 'instance-state-name', 'Values': ['pending', 'running', 'shutting-down', 'stopping', 'stopped']}]
+    async for page in paginator.paginate(Filters=filters):
+        for reserv in page['Reservations']:
+            for instance in reserv['Instances']:
+                records[instance['InstanceId']] = InstanceRecord(
+                    id=instance['InstanceId'],
+                    state=instance['State']['Name'],
+                    type=instance['InstanceType'],
+                    platform=instance.get('PlatformDetails', 'Linux/UNIX'),
+                )
+    return records
+
+
+async def _fetch_volumes(ec2) -> dict[str, VolumeRecord]:
+    records = {}
+    paginator = ec2.get_paginator('describe_volumes')
+    async for page in paginator.paginate(Filters=[{'Name': 'status', 'Values': ['available']}]):
+        for vol in page.get('Volumes', []):
+            records[vol['VolumeId']] = VolumeRecord(
+                id=vol['VolumeId'],
+                size=vol['Size'],
+                type=vol['VolumeType'],
+                attached=bool(vol.get('Attachments')),
+            )
+    return records
+
+
+async def _fetch_addresses(ec2) -> dict[str, AddressRecord]:
+    records = {}
+    # DescribeAddresses is not paginated, it always returns every address in the region
+    for addr in (await ec2.describe_addresses()).get('Addresses', []):
+        record = AddressRecord(
+            allocation_id=addr.get('AllocationId', 'N/A'),
+            public_ip=addr.get('PublicIp', 'N/A'),
+            instance_id=addr.get('InstanceId', 'N/A'),
+            network_interface_id=addr.get('NetworkInterfaceId', 'N/A'),
+            domain=addr.get('Domain', 'N/A'),
+        )
+        records[addr.get('AllocationId') or record.public_ip] = record
+    return records
+
+
+async def _fetch_nat_gateways(ec2) -> dict[str, NatGatewayRecord]:
+    records = {}
+    paginator = ec2.get_paginator('describe_nat_gateways')
+    async for page in paginator.paginate(Filter=[{'Name': 'state', 'Values': ['pending', 'available']}]):
+        for gw in page.get('NatGateways', []):
+            records[gw['NatGatewayId']] = NatGatewayRecord(
+                id=gw['NatGatewayId'],
+                allocation_ids=tuple(a['AllocationId'] for a in gw.get('NatGatewayAddresses', []) if 'AllocationId' in a),
+            )
+    return records
+
+
+FETCHERS = {
+    'instances': _fetch_instances,
+    'volumes': _fetch_volumes,
+    'addresses': _fetch_addresses,
+    'nat_gateways': _fetch_nat_gateways,
+}
+
+
+async def load_inventory(region: str, pool: ClientPool = client_pool, kinds: tuple[str, ...] = INVENTORY_KINDS) -> RegionInventory:
+    try:
+        started = time.perf_counter()
+        ec2 = await pool.get('ec2', region)
+        results = await asyncio.gather(*[FETCHERS[kind](ec2) for kind in kinds])
+        inventory = RegionInventory(region=region, **dict(zip(kinds, results)))
+        inventory.nat_by_allocation = {
+            allocation_id: gw.id
+            for gw in inventory.nat_gateways.values()
+            for allocation_id in gw.allocation_ids
+        }
+        logger.info(
+            f"inventory.load_inventory() Method: ✅ Loaded {', '.join(f'{len(r)} {k}' for k, r in zip(kinds, results))} "
+            f"in region {region} in {time.perf_counter() - started:.2f}s"
+        )
+        return inventory
+    except ClientError as err:
+        logger.error(f"Error in inventory.load_inventory() Method: ❌ AWS ClientError: {err}")
+        raise
+    except Exception as err:
+        logger.error(f"Error in inventory.load_inventory() Method: ❌ Unexpected error: {err}")
+        raise
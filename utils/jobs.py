@@ -0,0 +1,244 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable
+from logger import log_context, logger
+from utils.instrumentation import phase_latency, scan_latency, scans
+
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))  # scans allowed to run at the same time
+JOB_HISTORY = int(os.getenv('JOB_HISTORY', 200))  # finished jobs kept for status queries
+PROGRESS_YIELD_EVERY = 100  # resources between two cooperative yields to the event loop
+STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', 1000))  # events a stream client may lag behind before it is cut off
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    region: str
+    params: dict
+    key: tuple
+    status: str = 'queued'  # queued -> running -> succeeded | failed
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    resources_processed: int = 0
+    api_calls: int = 0
+    result: dict | None = None
+    error: str | None = None
+    timings: dict[str, float] = field(default_factory=dict)  # "<checker>.<phase>" -> seconds, summed over regions
+    task: asyncio.Task | None = field(default=None, repr=False)
+    # single-checker jobs publish their scan events for /optimizer/{checker}/stream; while anyone is watching the
+    # findings are kept so a second client joining the scan gets them too, nobody watching -> nothing is kept
+    feed: bool = False
+    events: list[tuple[str, dict]] = field(default_factory=list, repr=False)
+    subscribers: list[asyncio.Queue] = field(default_factory=list, repr=False)
+    final_event: tuple[str, dict] | None = field(default=None, repr=False)
+    replay_complete: bool = True  # False once a finding went by unwatched, late joiners then find it in the report
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_dict(self, timings: bool = False) -> dict:
+        content = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'region': self.region,
+            'params': self.params,
+            'status': self.status,
+            'resources_processed': self.resources_processed,
+            'api_calls': self.api_calls,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'result': self.result,
+            'error': self.error,
+        }
+        if timings:
+            content['timings'] = {name: round(seconds, 3) for name, seconds in sorted(self.timings.items())}
+        return content
+
+    def publish(self, event: str, data: dict) -> None:
+        if not self.feed or self.final_event is not None:
+            return
+        if event in ('done', 'error'):
+            self.final_event = (event, data)
+            self.events = []  # subscribers already hold what they still have to send
+        elif event != 'progress':
+            if self.subscribers:
+                self.events.append((event, data))
+            else:
+                self.replay_complete = False
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # a client that stopped reading is cut off rather than buffering the rest of the scan for it
+                self.subscribers.remove(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(('error', {'Error': "Stream fell behind the scan, the full results are in the job's report"}))
+
+    def end_feed(self) -> None:
+        # a scan that failed or never got to its 'done' event still closes every stream
+        if self.status == 'failed':
+            self.publish('error', {'Error': self.error})
+        else:
+            self.publish('done', self.result or {})
+
+    async def subscribe(self) -> AsyncIterator[tuple[str, dict]]:
+        if self.final_event is not None:
+            # joined after the scan ended, its rows are in the report
+            yield 'job', {'job_id': self.id, 'status': self.status, 'replay_complete': False}
+            yield self.final_event
+            return
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        # what was published before this point is replayed from the list, anything later arrives on the queue
+        replay, replayed = self.events, len(self.events)
+        self.subscribers.append(queue)
+        try:
+            yield 'job', {'job_id': self.id, 'status': self.status, 'replay_complete': self.replay_complete}
+            for item in replay[:replayed]:
+                yield item
+            while True:
+                event, data = await queue.get()
+                yield event, data
+                if event in ('done', 'error'):
+                    return
+        finally:
+            if queue in self.subscribers:
+                self.subscribers.remove(queue)
+            if not self.subscribers and self.final_event is None:
+                # the last client left, what it saw is not kept for nobody
+                self.events = []
+                self.replay_complete = False
+
+
+current_job: ContextVar[Job | None] = ContextVar('current_job', default=None)
+
+
+async def report_progress(resources: int = 1) -> None:
+    job = current_job.get()
+    if job is None:
+        return
+    before = job.resources_processed
+    job.resources_processed += resources
+    # long checker loops hand the event loop back regularly so API requests keep being served
+    if before // PROGRESS_YIELD_EVERY != job.resources_processed // PROGRESS_YIELD_EVERY:
+        await asyncio.sleep(0)
+
+
+@contextmanager
+def phase(checker: str, name: str):
+    # times one step of a checker (describe, metrics, pricing, report) for /metrics and the job's breakdown
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        phase_latency.observe(checker, name, value=elapsed)
+        job = current_job.get()
+        if job is not None:
+            key = f"{checker}.{name}"
+            job.timings[key] = job.timings.get(key, 0.0) + elapsed
+
+
+def count_api_call(**kwargs) -> None:
+    # registered as a botocore 'before-parameter-build' handler, so it runs in the calling task's context
+    job = current_job.get()
+    if job is not None:
+        job.api_calls += 1
+
+
+class JobScheduler:
+    def __init__(self, max_workers: int = JOB_WORKERS, max_history: int = JOB_HISTORY):
+        self.max_history = max_history
+        self._workers = asyncio.Semaphore(max_workers)
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._active: dict[tuple, Job] = {}
+
+    def submit(self, kind: str, region: str, params: dict, factory: Callable[[], Awaitable], feed: bool = False) -> tuple[Job, bool]:
+        key = (kind, region, json.dumps(params, sort_keys=True))
+        job = self._active.get(key)
+        if job is not None:
+            # an identical scan is already queued or running, share it instead of racing it
+            logger.info(f"JobScheduler.submit() Method: ✅ Coalesced {kind} scan for {region} onto job {job.id}")
+            return job, False
+        job = Job(id=uuid.uuid4().hex, kind=kind, region=region, params=params, key=key, feed=feed)
+        self._jobs[job.id] = job
+        self._active[key] = job
+        job.task = asyncio.create_task(self._run(job, factory))
+        self._trim_history()
+        return job, True
+
+    async def _run(self, job: Job, factory: Callable[[], Awaitable]) -> None:
+        token = current_job.set(job)
+        log_token = log_context.set({'scan_id': job.id, 'checker': job.kind, 'region': job.region})
+        try:
+            async with self._workers:
+                job.status = 'running'
+                job.started_at = time.time()
+                result = await factory()
+                if hasattr(result, 'status_code') and hasattr(result, 'body'):
+                    # checkers answer with a JSONResponse
+                    job.result = json.loads(result.body)
+                    job.status = 'succeeded' if result.status_code < 400 else 'failed'
+                    job.error = job.result.get('Error')
+                else:
+                    job.result = result
+                    job.status = 'succeeded'
+        except asyncio.CancelledError:
+            job.status = 'failed'
+            job.error = 'Cancelled'
+            raise
+        except Exception as err:
+            logger.error(f"Error in JobScheduler._run() Method: ❌ Job {job.id} ({job.kind} {job.region}) failed: {err}")
+            job.status = 'failed'
+            job.error = str(err)
+        finally:
+            current_job.reset(token)
+            job.finished_at = time.time()
+            job.end_feed()
+            scans.inc(job.kind, job.status)
+            scan_latency.observe(job.kind, value=job.elapsed)
+            self._active.pop(job.key, None)
+            logger.info(f"JobScheduler._run() Method: ✅ Job {job.id} {job.status} in {job.elapsed:.2f}s")
+            log_context.reset(log_token)
+
+    def _trim_history(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def list(self) -> list[Job]:
+        return list(self._jobs.values())
+
+    async def shutdown(self) -> None:
+        jobs = list(self._active.values())
+        for job in jobs:
+            job.task.cancel()
+        await asyncio.gather(*[job.task for job in jobs], return_exceptions=True)
+        for job in jobs:
+            # a task cancelled before its first step never ran _run's cleanup
+            if job.finished_at is None:
+                job.status, job.error, job.finished_at = 'failed', 'Cancelled', time.time()
+                job.end_feed()
+        self._active.clear()
+
+
+job_scheduler = JobScheduler()
+
+
+def get_job_scheduler() -> JobScheduler:
+    return job_scheduler
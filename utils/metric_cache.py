@@ -0,0 +1,197 @@
+import asyncio
+import os
+import re
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+from logger import logger
+from utils.account_scope import scoped_dir
+from utils.cloudwatch import get_metric_data_batched
+from utils.instrumentation import metrics
+
+
+METRIC_CACHE_DIR = Path(os.getenv('METRIC_CACHE_DIR', 'cache/metrics'))
+METRIC_CACHE_RETENTION_DAYS = int(os.getenv('METRIC_CACHE_RETENTION_DAYS', 35))  # hours older than this are evicted
+METRIC_CACHE_SETTLE_HOURS = int(os.getenv('METRIC_CACHE_SETTLE_HOURS', 2))  # recent hours fetched again, CloudWatch fills them late
+HOUR = 3600
+DAY_HOURS = 24  # one file per UTC day, a scan only rewrites the days it fetched
+
+
+@dataclass
+class MetricBlock:
+    # one region/metric/stat: instances x hours starting at `start` (epoch hours), float32 with NaN for no datapoint
+    ids: list[str]
+    start: int
+    values: np.ndarray
+    fetched_from: np.ndarray  # per instance, first hour known to be fetched
+    fetched_until: np.ndarray  # per instance, hour the last fetch ended at (exclusive)
+
+    @classmethod
+    def empty(cls, start: int) -> 'MetricBlock':
+        return cls(ids=[], start=start, values=np.empty((0, 0), dtype=np.float32),
+                   fetched_from=np.empty(0, dtype=np.int64), fetched_until=np.empty(0, dtype=np.int64))
+
+    def evict(self, cutoff: int) -> None:
+        # drop hours before the retention cutoff and instances not fetched since then (terminated)
+        if self.start < cutoff:
+            self.values = self.values[:, cutoff - self.start:]
+            self.start = cutoff
+            self.fetched_from = np.maximum(self.fetched_from, cutoff)
+        keep = self.fetched_until > cutoff
+        if not keep.all():
+            self.ids = [i for i, k in zip(self.ids, keep) if k]
+            self.values, self.fetched_from, self.fetched_until = self.values[keep], self.fetched_from[keep], self.fetched_until[keep]
+
+    def ensure(self, instance_ids: list[str], start: int, end: int) -> dict[str, int]:
+        # grow the block to hold every requested instance and the [start, end) hour range
+        index = {instance_id: row for row, instance_id in enumerate(self.ids)}
+        new = [i for i in dict.fromkeys(instance_ids) if i not in index]
+        for instance_id in new:
+            index[instance_id] = len(self.ids)
+            self.ids.append(instance_id)
+        first = min(self.start, start) if self.values.size else start
+        last = max(self.start + self.values.shape[1], end)
+        if new or first != self.start or last != self.start + self.values.shape[1]:
+            values = np.full((len(self.ids), last - first), np.nan, dtype=np.float32)
+            offset = self.start - first
+            values[:self.values.shape[0], offset:offset + self.values.shape[1]] = self.values
+            self.values, self.start = values, first
+            self.fetched_from = np.concatenate([self.fetched_from, np.full(len(new), end, dtype=np.int64)])
+            self.fetched_until = np.concatenate([self.fetched_until, np.full(len(new), end, dtype=np.int64)])
+        return index
+
+
+class MetricCache:
+    def __init__(self, root: Path = METRIC_CACHE_DIR, retention_days: int = METRIC_CACHE_RETENTION_DAYS,
+                 settle_hours: int = METRIC_CACHE_SETTLE_HOURS):
+        self.root = root
+        self.retention_hours = retention_days * 24
+        self.settle_hours = settle_hours
+        self._locks: dict[Path, asyncio.Lock] = {}
+        self.stats = {'hours_cached': 0, 'hours_fetched': 0}
+
+    def _path(self, region: str, metric_name: str, stat: str) -> Path:
+        # <region>/<metric>.<stat>/index.npz holds the ids and fetched ranges, <day>.npz the values of one UTC day
+        return scoped_dir(self.root) / region / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', metric_name)}.{stat}"
+
+    @staticmethod
+    def _write(path: Path, **arrays) -> None:
+        # written next to the target and swapped in, a crash leaves the previous file intact
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _load(self, path: Path, start: int) -> MetricBlock:
+        index_path = path / 'index.npz'
+        if not index_path.exists():
+            return MetricBlock.empty(start)
+        try:
+            with np.load(index_path) as data:
+                ids = data['ids'].tolist()
+                fetched_from, fetched_until = data['fetched_from'], data['fetched_until']
+            rows = {instance_id: row for row, instance_id in enumerate(ids)}
+            days = sorted(int(p.stem) for p in path.glob('*.npz') if p.stem.isdigit())
+            if not days:
+                return MetricBlock(ids=ids, start=start, values=np.full((len(ids), 0), np.nan, dtype=np.float32),
+                                   fetched_from=fetched_from, fetched_until=fetched_until)
+            block_start = days[0] * DAY_HOURS
+            values = np.full((len(ids), (days[-1] + 1) * DAY_HOURS - block_start), np.nan, dtype=np.float32)
+            for day in days:
+                with np.load(path / f"{day}.npz") as data:
+                    # a day file may still list instances the index has since evicted, or miss ones added later
+                    known = [(rows[i], n) for n, i in enumerate(data['ids'].tolist()) if i in rows]
+                    if known:
+                        target, source = map(list, zip(*known))
+                        column = day * DAY_HOURS - block_start
+                        values[target, column:column + DAY_HOURS] = data['values'][source]
+            return MetricBlock(ids=ids, start=block_start, values=values, fetched_from=fetched_from, fetched_until=fetched_until)
+        except (OSError, KeyError, ValueError) as err:
+            logger.error(f"❌ Error in MetricCache._load() Method: discarding unreadable {path}: {err}")
+            return MetricBlock.empty(start)
+
+    def _save(self, path: Path, block: MetricBlock, days: set[int], cutoff: int) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+        ids = np.array(block.ids, dtype=str)
+        for day in sorted(days):
+            values = np.full((len(block.ids), DAY_HOURS), np.nan, dtype=np.float32)
+            first, last = max(day * DAY_HOURS, block.start), min((day + 1) * DAY_HOURS, block.start + block.values.shape[1])
+            if first < last:
+                values[:, first - day * DAY_HOURS:last - day * DAY_HOURS] = block.values[:, first - block.start:last - block.start]
+            self._write(path / f"{day}.npz", ids=ids, values=values)
+        # the index goes last: until it is replaced the old fetched ranges are kept and those hours are fetched again
+        self._write(path / 'index.npz', ids=ids, fetched_from=block.fetched_from, fetched_until=block.fetched_until)
+        for day_path in path.glob('*.npz'):
+            if day_path.stem.isdigit() and (int(day_path.stem) + 1) * DAY_HOURS <= cutoff:
+                day_path.unlink(missing_ok=True)
+        path.with_name(f"{path.name}.npz").unlink(missing_ok=True)  # single-file layout of earlier versions
+
+    def _fetch_plan(self, block: MetricBlock, index: dict[str, int], instance_ids: list[str], start: int, end: int) -> dict[int, list[str]]:
+        # instances grouped by the hour their fetch has to start at, usually a single group
+        plan = defaultdict(list)
+        for instance_id in instance_ids:
+            row = index[instance_id]
+            fetched_from, fetched_until = block.fetched_from[row], block.fetched_until[row]
+            if fetched_from > start or fetched_until < start:
+                fetch_start = start  # never fetched, or a gap since the last scan
+            else:
+                fetch_start = max(start, fetched_until - self.settle_hours)
+            if fetch_start < end:
+                plan[int(fetch_start)].append(instance_id)
+        return plan
+
+    async def get_matrix(self, cw, region: str, instance_ids: list[str], metric_name: str, start_time: datetime,
+                         end_time: datetime, stat: str = 'Average') -> np.ndarray:
+        # hourly instances x hours matrix for [start_time, end_time), only hours not cached yet hit CloudWatch
+        start, end = int(start_time.timestamp()) // HOUR, int(end_time.timestamp()) // HOUR
+        path = self._path(region, metric_name, stat)
+        async with self._locks.setdefault(path, asyncio.Lock()):
+            block = await asyncio.to_thread(self._load, path, start)
+            cutoff = end - self.retention_hours
+            block.evict(cutoff)
+            index = block.ensure(instance_ids, start, end)
+            plan = self._fetch_plan(block, index, instance_ids, start, end)
+            results = await asyncio.gather(*[
+                get_metric_data_batched(cw, instance_ids=ids, metric_name=metric_name, period=HOUR, stat=stat,
+                                        start_time=datetime.fromtimestamp(fetch_start * HOUR, timezone.utc), end_time=end_time)
+                for fetch_start, ids in plan.items()
+            ])
+            fetched = 0
+            for (fetch_start, ids), series in zip(plan.items(), results):
+                rows = np.array([index[i] for i in ids], dtype=np.int64)
+                gap = (block.fetched_from[rows] > fetch_start) | (block.fetched_until[rows] < fetch_start)
+                block.values[rows, fetch_start - block.start:end - block.start] = np.nan
+                for instance_id, points in series.items():
+                    row = index[instance_id]
+                    for ts, value in points:
+                        column = int(ts.timestamp()) // HOUR - block.start
+                        if 0 <= column < block.values.shape[1]:
+                            block.values[row, column] = value
+                block.fetched_from[rows] = np.where(gap, fetch_start, np.minimum(block.fetched_from[rows], fetch_start))
+                block.fetched_until[rows] = end
+                fetched += len(ids) * (end - fetch_start)
+            self.stats['hours_fetched'] += fetched
+            self.stats['hours_cached'] += len(instance_ids) * (end - start) - fetched
+            if plan:
+                started = time.perf_counter()
+                days = {day for fetch_start in plan for day in range(fetch_start // DAY_HOURS, (end - 1) // DAY_HOURS + 1)}
+                await asyncio.to_thread(self._save, path, block, days, cutoff)
+                logger.info(f"MetricCache.get_matrix() Method: ✅ {metric_name} {region}: fetched {fetched} instance-hours, "
+                            f"saved in {time.perf_counter() - started:.2f}s")
+            rows = [index[i] for i in instance_ids]
+            return block.values[rows, start - block.start:end - block.start].astype(float)
+
+
+metric_cache = MetricCache()
+metrics.collected('optimizer_metric_cache_instance_hours_total', 'Instance-hours of CloudWatch data served from the cache or fetched', 'counter',
+                  ('source',), lambda: [(('cached',), metric_cache.stats['hours_cached']), (('fetched',), metric_cache.stats['hours_fetched'])])
@@ -0,0 +1,192 @@
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+from logger import logger, start_logging
+from utils.regions import LOCATION_REGION_MAP
+
+
+OFFLINE_PRICING_DB = Path(os.getenv('OFFLINE_PRICING_DB', 'cache/offline_pricing.sqlite'))
+IMPORT_BATCH_SIZE = 5000
+
+# normalized price list attribute -> table column; JSON offers use "instanceType",
+# CSV offers use "Instance Type", both normalize to "instancetype"
+ATTRIBUTE_COLUMNS = {
+    'productfamily': 'product_family',
+    'instancetype': 'instance_type',
+    'operatingsystem': 'operating_system',
+    'tenancy': 'tenancy',
+    'preinstalledsw': 'pre_installed_sw',
+    'capacitystatus': 'capacity_status',
+    'licensemodel': 'license_model',
+    'volumeapiname': 'volume_api_name',
+    'volumetype': 'volume_type',
+    'usagetype': 'usage_type',
+    'group': 'grp',
+    'storagemedia': 'storage_media',  # snapshot storage tier, "Amazon S3" / "Amazon S3 Glacier"
+}
+COLUMNS = ['service', 'region', *ATTRIBUTE_COLUMNS.values(), 'unit', 'price']
+# named columns: in tables migrated by _connect the added ones come last
+INSERT_PRICE = f"INSERT INTO prices ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+
+class AmbiguousPriceError(ValueError):
+    # the filters match several SKUs at different prices, raised by the offline table and the Pricing API path
+    pass
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS prices ({', '.join(f'{c} TEXT' for c in COLUMNS[:-1])}, price REAL NOT NULL)")
+    # tables imported before a column was added get it empty, the next import fills it
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(prices)")}
+    for column in ATTRIBUTE_COLUMNS.values():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE prices ADD COLUMN {column} TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS prices_compute ON prices (service, region, instance_type, operating_system, tenancy)")
+    conn.execute("CREATE INDEX IF NOT EXISTS prices_storage ON prices (service, region, product_family, volume_api_name)")
+    return conn
+
+
+def _region(attributes: dict) -> str | None:
+    return attributes.get('regioncode') or LOCATION_REGION_MAP.get(attributes.get('location', ''))
+
+
+def _row(service: str, attributes: dict, unit: str, price: str) -> tuple | None:
+    region = _region(attributes)
+    if not region:
+        return None
+    return (service, region, *(attributes.get(key) for key in ATTRIBUTE_COLUMNS), unit, float(price))
+
+
+def _iter_json_offer(path: Path):
+    # offer files run to several GB (EC2), so they are parsed incrementally and never loaded whole:
+    # one pass keeps only the first-tier USD price of every on-demand SKU, a second one streams the products
+    import ijson
+    with open(path, 'rb') as f:
+        service = next(ijson.items(f, 'offerCode'), None)
+    on_demand: dict[str, list[tuple[str, str]]] = {}
+    with open(path, 'rb') as f:
+        for sku, terms in ijson.kvitems(f, 'terms.OnDemand'):
+            for term in terms.values():
+                for dimension in term.get('priceDimensions', {}).values():
+                    if dimension.get('beginRange', '0') != '0' or 'USD' not in dimension.get('pricePerUnit', {}):
+                        continue  # keep the first tier in USD only
+                    on_demand.setdefault(sku, []).append((dimension.get('unit'), dimension['pricePerUnit']['USD']))
+    with open(path, 'rb') as f:
+        for sku, product in ijson.kvitems(f, 'products'):
+            prices = on_demand.get(sku)
+            if not prices:
+                continue
+            attributes = {_normalize(k): v for k, v in product.get('attributes', {}).items()}
+            attributes['productfamily'] = product.get('productFamily', attributes.get('productfamily'))
+            for unit, price in prices:
+                row = _row(attributes.get('servicecode', service), attributes, unit, price)
+                if row:
+                    yield row
+
+
+def _iter_csv_offer(path: Path):
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        # the CSV price list starts with a few metadata lines before the real header
+        for header in reader:
+            if header and header[0] == 'SKU':
+                break
+        columns = [_normalize(name) for name in header]
+        for values in reader:
+            record = dict(zip(columns, values))
+            if record.get('termtype') != 'OnDemand' or record.get('currency') != 'USD':
+                continue
+            if record.get('startingrange', '0') not in ('0', ''):
+                continue
+            row = _row(record.get('servicecode'), record, record.get('unit'), record.get('priceperunit') or 0)
+            if row:
+                yield row
+
+
+def import_offer_files(paths: list[str | Path], db_path: Path = OFFLINE_PRICING_DB) -> int:
+    started = time.perf_counter()
+    conn = _connect(db_path)
+    imported = 0
+    replaced = set()
+    try:
+        with conn:
+            for path in map(Path, paths):
+                rows = _iter_csv_offer(path) if path.suffix == '.csv' else _iter_json_offer(path)
+                batch = []
+                for row in rows:
+                    if row[:2] not in replaced:
+                        # re-importing a newer offer replaces that service/region instead of duplicating it
+                        conn.execute("DELETE FROM prices WHERE service = ? AND region = ?", row[:2])
+                        replaced.add(row[:2])
+                    batch.append(row)
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        imported += len(batch)
+                        conn.executemany(INSERT_PRICE, batch)
+                        batch.clear()
+                imported += len(batch)
+                conn.executemany(INSERT_PRICE, batch)
+                logger.info(f"offline_pricing.import_offer_files() Method: ✅ Imported {path}")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    logger.info(f"offline_pricing.import_offer_files() Method: ✅ {imported} prices imported in {time.perf_counter() - started:.1f}s")
+    return imported
+
+
+_reader_conn: sqlite3.Connection | None = None
+_reader_columns: set[str] = set()
+
+
+def _reader() -> sqlite3.Connection | None:
+    global _reader_conn, _reader_columns
+    # opened on first use, so a table imported while the API is running is picked up
+    if _reader_conn is None and OFFLINE_PRICING_DB.exists():
+        _reader_conn = sqlite3.connect(f"file:{OFFLINE_PRICING_DB}?mode=ro", uri=True, check_same_thread=False)
+        _reader_columns = {row[1] for row in _reader_conn.execute("PRAGMA table_info(prices)")}
+    return _reader_conn
+
+
+def offline_pricing_available() -> bool:
+    return _reader() is not None
+
+
+def lookup_price(service_code: str, filters: list, region: str) -> float | None:
+    conn = _reader()
+    if conn is None:
+        return None
+    where, params = ['service = ?', 'region = ?'], [service_code, region]
+    for f in filters:
+        field = _normalize(f['Field'])
+        if field == 'location':
+            continue  # already covered by region
+        column = ATTRIBUTE_COLUMNS.get(field)
+        if column is None or column not in _reader_columns:
+            return None  # filter the table can't answer, let the Pricing API resolve it
+        where.append(f"{column} = ?")
+        params.append(f['Value'])
+    rows = conn.execute(
+        f"SELECT DISTINCT price FROM prices WHERE {' AND '.join(where)} AND price > 0 LIMIT 2", params
+    ).fetchall()
+    if len(rows) > 1:
+        # the cheapest match is usually a license or software variant, not the resource being priced
+        raise AmbiguousPriceError(f"Ambiguous offline price for service {service_code} in {region} with filters {filters}")
+    return rows[0][0] if rows else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import AWS bulk price list offer files for offline pricing")
+    parser.add_argument('files', nargs='+', help="offer index.json or index.csv files (EC2, VPC, ...)")
+    parser.add_argument('--db', default=str(OFFLINE_PRICING_DB), help="SQLite file to write the price table to")
+    args = parser.parse_args()
+    start_logging()
+    print(f"Imported {import_offer_files(args.files, Path(args.db))} prices into {args.db}")
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from logger import logger
+from utils.utils import get_aws_resource_price
+from utils.offline_pricing import AmbiguousPriceError, lookup_price
+from utils.rate_limiter import rate_limiter
+from utils.instrumentation import metrics
+
+
+PRICE_CACHE_TTL = int(os.getenv('PRICE_CACHE_TTL', 24 * 3600))  # seconds
+PRICE_CACHE_SIZE = int(os.getenv('PRICE_CACHE_SIZE', 4096))
+PRICE_CACHE_DB = Path(os.getenv('PRICE_CACHE_DB', 'cache/pricing.sqlite'))
+OFFLINE_PRICING_ONLY = os.getenv('OFFLINE_PRICING_ONLY', 'false').lower() in ('1', 'true', 'yes')  # never call the Pricing API
+
+
+def make_price_key(service_code: str, filters: list, region: str) -> str:
+    # 'Type' is always TERM_MATCH and the checkers pass filters in arbitrary order,
+    # so only the sorted (Field, Value) pairs identify a price.
+    normalized = sorted({(f['Field'], str(f['Value'])) for f in filters})
+    return json.dumps([service_code, region, normalized], separators=(',', ':'))
+
+
+class DiskPriceStore:
+    def __init__(self, path: Path):
+        self.path = path
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS prices (key TEXT PRIMARY KEY, price REAL NOT NULL, fetched_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str, ttl: float) -> float | None:
+        row = self._connect().execute("SELECT price, fetched_at FROM prices WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > ttl:
+            return None
+        return row[0]
+
+    def put(self, key: str, price: float) -> None:
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO prices (key, price, fetched_at) VALUES (?, ?, ?)", (key, price, time.time()))
+        conn.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class PriceCache:
+    def __init__(self, ttl: float = PRICE_CACHE_TTL, max_size: int = PRICE_CACHE_SIZE, disk: DiskPriceStore | None = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.disk = disk
+        self._memory: OrderedDict[str, tuple[float, float]] = OrderedDict()  # key -> (price, expires_at)
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self._lock = asyncio.Lock()  # serializes sqlite access across worker threads
+        self.stats = {'memory_hits': 0, 'offline_hits': 0, 'disk_hits': 0, 'misses': 0, 'coalesced': 0}
+
+    def _memory_get(self, key: str) -> float | None:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        price, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return price
+
+    def _memory_put(self, key: str, price: float) -> None:
+        self._memory[key] = (price, time.monotonic() + self.ttl)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    async def get_price(self, service_code: str, filters: list, region: str) -> float:
+        key = make_price_key(service_code, filters, region)
+        price = self._memory_get(key)
+        if price is not None:
+            self.stats['memory_hits'] += 1
+            return price
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            # Another task is already resolving this key, share its result.
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(in_flight)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            price = await self._resolve(key, service_code, filters, region)
+            self._memory_put(key, price)
+            future.set_result(price)
+            return price
+        except BaseException as err:
+            future.set_exception(err)
+            future.exception()  # mark retrieved so lone failures are not reported as unhandled
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def _resolve(self, key: str, service_code: str, filters: list, region: str) -> float:
+        ambiguous = None
+        try:
+            async with self._lock:
+                price = await asyncio.to_thread(lookup_price, service_code, filters, region)
+        except AmbiguousPriceError as err:
+            # several offline SKUs match, the disk cache or the Pricing API may still pin down one price
+            logger.warning(f"PriceCache._resolve() Method: ⚠️ {err}, trying the cache and the Pricing API")
+            price, ambiguous = None, err
+        if price is not None:
+            self.stats['offline_hits'] += 1
+            return price
+        if OFFLINE_PRICING_ONLY:
+            if ambiguous is not None:
+                raise ambiguous
+            raise ValueError(f"No offline price for service {service_code} in {region} with filters {filters}")
+        if self.disk is not None:
+            async with self._lock:
+                price = await asyncio.to_thread(self.disk.get, key, self.ttl)
+            if price is not None:
+                self.stats['disk_hits'] += 1
+                return price
+        self.stats['misses'] += 1
+        price = await rate_limiter.get('pricing', 'us-east-1').call(
+            asyncio.to_thread, get_aws_resource_price, service_code=service_code, filters=filters, region=region, operation='GetProducts'
+        )
+        if self.disk is not None:
+            try:
+                async with self._lock:
+                    await asyncio.to_thread(self.disk.put, key, price)
+            except sqlite3.Error as err:
+                logger.error(f"❌ Error in PriceCache._resolve() Method: could not persist price for {key}: {err}")
+        return price
+
+    def clear(self) -> None:
+        self._memory.clear()
+
+
+price_cache = PriceCache(disk=DiskPriceStore(PRICE_CACHE_DB))
+
+
+def _price_cache_hit_ratio() -> list[tuple[tuple, float]]:
+    hits = sum(v for k, v in price_cache.stats.items() if k != 'misses')
+    total = hits + price_cache.stats['misses']
+    return [((), hits / total if total else 0.0)]
+
+
+metrics.collected('optimizer_price_cache_lookups_total', 'Price lookups by where they were answered', 'counter', ('result',),
+                  lambda: [((result,), count) for result, count in price_cache.stats.items()])
+metrics.collected('optimizer_price_cache_hit_ratio', 'Share of price lookups answered without the Pricing API', 'gauge', (), _price_cache_hit_ratio)
+
+
+async def get_cached_price(service_code: str, filters: list, region: str) -> float:
+    return await price_cache.get_price(service_code=service_code, filters=filters, region=region)
@@ -0,0 +1,265 @@
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import time
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+from logger import logger
+from utils.instrumentation import aws_calls, aws_latency, aws_retries, aws_throttles, metrics
+
+
+# error codes AWS uses when a caller exceeds its request rate
+THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException', 'RequestThrottled',
+    'TooManyRequestsException', 'RequestLimitExceeded', 'EC2ThrottledException', 'SlowDown',
+    'BandwidthLimitExceeded', 'PriorRequestNotComplete', 'ProvisionedThroughputExceededException',
+}
+TRANSIENT_CODES = {'InternalError', 'InternalFailure', 'ServiceUnavailable', 'Unavailable', 'RequestTimeout', 'RequestTimeoutException'}
+
+RATE_LIMIT_RETRIES = int(os.getenv('RATE_LIMIT_RETRIES', 8))
+RATE_LIMIT_BASE_DELAY = 0.25  # seconds, full-jitter exponential backoff
+RATE_LIMIT_MAX_DELAY = 20.0
+RATE_LIMIT_MAX_CONCURRENCY = int(os.getenv('RATE_LIMIT_MAX_CONCURRENCY', 32))  # in-flight calls per service/region
+RATE_LIMIT_INITIAL_CONCURRENCY = 4
+RATE_LIMIT_HEADROOM = 2.0  # the rate may ramp up to this multiple of the starting rate
+RATE_LIMIT_COOLDOWN = 1.0  # seconds, throttles within this window count as one congestion signal
+# requests per second each service starts at, close to the documented per-account API limits
+DEFAULT_RATES = {'ec2': 20.0, 'cloudwatch': 40.0, 'pricing': 10.0, 'ce': 5.0, 'sts': 20.0, 'organizations': 5.0}
+DEFAULT_RATE = 10.0
+
+
+def error_code(err: Exception) -> str | None:
+    if isinstance(err, ClientError):
+        return err.response.get('Error', {}).get('Code')
+    return None
+
+
+def is_retryable(err: Exception) -> bool:
+    return error_code(err) in THROTTLE_CODES | TRANSIENT_CODES or isinstance(err, (BotoConnectionError, HTTPClientError))
+
+
+class AdaptiveLimiter:
+    # Token bucket for the request rate plus an AIMD window for in-flight calls: every success adds a little
+    # to both, a throttle halves both, so each service/region settles just under what AWS accepts.
+    def __init__(self, service: str, region: str, rate: float | None = None, max_concurrency: int = RATE_LIMIT_MAX_CONCURRENCY):
+        self.service = service
+        self.region = region
+        self.rate = rate or DEFAULT_RATES.get(service, DEFAULT_RATE)
+        self.min_rate = self.rate / 16
+        self.max_rate = self.rate * RATE_LIMIT_HEADROOM
+        self.concurrency = float(min(RATE_LIMIT_INITIAL_CONCURRENCY, max_concurrency))
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.counters = {'calls': 0, 'throttles': 0, 'retries': 0, 'errors': 0}
+        self._tokens = self.rate
+        self._refilled_at = time.monotonic()
+        self._backed_off_at = 0.0
+        self._bucket_lock = asyncio.Lock()
+        self._slots = asyncio.Condition()
+
+    async def _take_token(self) -> None:
+        async with self._bucket_lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _acquire(self) -> None:
+        async with self._slots:
+            await self._slots.wait_for(lambda: self.in_flight < int(self.concurrency))
+            self.in_flight += 1
+        try:
+            await self._take_token()
+        except BaseException:
+            await self._release()
+            raise
+
+    async def _release(self) -> None:
+        async with self._slots:
+            self.in_flight -= 1
+            self._slots.notify_all()
+
+    def _on_success(self) -> None:
+        # additive increase: about +1 in-flight call per window of successes, +0.5 req/s per rate's worth
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+        self.rate = min(self.max_rate, self.rate + 0.5 / self.rate)
+
+    def _on_throttle(self) -> None:
+        now = time.monotonic()
+        if now - self._backed_off_at < RATE_LIMIT_COOLDOWN:
+            return  # the calls in flight together all saw the same congestion
+        self._backed_off_at = now
+        self.concurrency = max(1.0, self.concurrency / 2)
+        self.rate = max(self.min_rate, self.rate / 2)
+        logger.info(f"AdaptiveLimiter() Method: throttled by {self.service} in {self.region}, "
+                    f"backing off to {self.rate:.1f} req/s and {int(self.concurrency)} in flight")
+
+    def _observe(self, labels: tuple, started: float, err: Exception | None = None) -> None:
+        aws_latency.observe(*labels, value=time.perf_counter() - started)
+        if err is None:
+            aws_calls.inc(*labels, 'ok')
+            self._on_success()
+            return
+        aws_calls.inc(*labels, 'error')
+        if error_code(err) in THROTTLE_CODES:
+            self.counters['throttles'] += 1
+            aws_throttles.inc(*labels)
+            self._on_throttle()
+
+    def _retry_delay(self, labels: tuple, err: Exception, attempt: int) -> float | None:
+        # seconds to wait before attempt + 1, None once the error is final
+        if not is_retryable(err) or attempt > RATE_LIMIT_RETRIES:
+            self.counters['errors'] += 1
+            return None
+        self.counters['retries'] += 1
+        aws_retries.inc(*labels)
+        return random.uniform(0, min(RATE_LIMIT_MAX_DELAY, RATE_LIMIT_BASE_DELAY * 2 ** attempt))
+
+    async def call(self, fn, *args, operation: str = 'call', **kwargs):
+        labels = (self.service, operation, self.region)
+        attempt = 0
+        while True:
+            await self._acquire()
+            self.counters['calls'] += 1
+            attempt += 1
+            started = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as err:
+                await self._release()
+                self._observe(labels, started, err)
+                delay = self._retry_delay(labels, err, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            await self._release()
+            self._observe(labels, started)
+            return result
+
+    def stats(self) -> dict:
+        return {
+            'service': self.service,
+            'region': self.region,
+            'rate': round(self.rate, 2),
+            'concurrency': int(self.concurrency),
+            'in_flight': self.in_flight,
+            **self.counters,
+        }
+
+
+class PageRequest:
+    # the page a LimitedPaginator is fetching; the botocore hooks below only act while one is set
+    def __init__(self, limiter: AdaptiveLimiter):
+        self.limiter = limiter
+        self.held = False  # a slot is taken for the attempt on the wire
+        self.started = 0.0
+
+
+current_page_request: contextvars.ContextVar[PageRequest | None] = contextvars.ContextVar('current_page_request', default=None)
+
+
+async def _before_page_send(event_name: str, **kwargs) -> None:
+    # botocore 'before-send' handler, once per HTTP attempt and in the calling task's context like count_api_call
+    page = current_page_request.get()
+    if page is None:
+        return None
+    await page.limiter._acquire()
+    page.limiter.counters['calls'] += 1
+    page.held, page.started = True, time.perf_counter()
+    return None
+
+
+async def _page_needs_retry(attempts: int, operation=None, response=None, caught_exception=None, **kwargs) -> float | None:
+    # botocore 'needs-retry' handler: the client is built with total_max_attempts=1, so a page is retried
+    # exactly when this returns a delay, with the same backoff and throttle feedback as AdaptiveLimiter.call
+    page = current_page_request.get()
+    if page is None or not page.held:
+        return None
+    limiter = page.limiter
+    page.held = False
+    await limiter._release()
+    err = caught_exception
+    if err is None and response is not None and response[0].status_code >= 300:
+        err = ClientError(response[1], operation.name)
+    labels = (limiter.service, operation.name, limiter.region)
+    limiter._observe(labels, page.started, err)
+    return limiter._retry_delay(labels, err, attempts) if err is not None else None
+
+
+class LimitedPaginator:
+    # Iterates the client's own paginator; every page request goes through the limiter by way of the hooks above.
+    def __init__(self, paginator, limiter: AdaptiveLimiter):
+        self._paginator = paginator
+        self._limiter = limiter
+
+    def __getattr__(self, name: str):
+        return getattr(self._paginator, name)
+
+    async def paginate(self, **kwargs):
+        pages = self._paginator.paginate(**kwargs).__aiter__()
+        while True:
+            page_request = PageRequest(self._limiter)
+            token = current_page_request.set(page_request)
+            try:
+                page = await pages.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                current_page_request.reset(token)
+                if page_request.held:
+                    await self._limiter._release()  # cancelled while the request was on the wire
+            yield page
+
+
+class LimitedClient:
+    # Wraps an aiobotocore client so every API call and paginator page goes through the limiter;
+    # everything else (meta, exceptions, ...) is the client's own.
+    def __init__(self, client, limiter: AdaptiveLimiter):
+        self._client = client
+        self._limiter = limiter
+        self._operations = client.meta.method_to_api_mapping  # describe_volumes -> DescribeVolumes
+        client.meta.events.register('before-send', _before_page_send)
+        client.meta.events.register('needs-retry', _page_needs_retry)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if name in self._operations:
+            return functools.partial(self._limiter.call, attr, operation=self._operations[name])
+        return attr
+
+    def get_paginator(self, operation_name: str) -> LimitedPaginator:
+        return LimitedPaginator(self._client.get_paginator(operation_name), self._limiter)
+
+
+class RateLimiterRegistry:
+    def __init__(self):
+        self._limiters: dict[tuple[str, str], AdaptiveLimiter] = {}
+
+    def get(self, service: str, region: str) -> AdaptiveLimiter:
+        key = (service, region)
+        if key not in self._limiters:
+            self._limiters[key] = AdaptiveLimiter(service, region)
+        return self._limiters[key]
+
+    def wrap(self, client, service: str, region: str) -> LimitedClient:
+        return LimitedClient(client, self.get(service, region))
+
+    def stats(self) -> list[dict]:
+        return [limiter.stats() for limiter in self._limiters.values()]
+
+
+rate_limiter = RateLimiterRegistry()
+metrics.collected('aws_rate_limit_requests_per_second', 'Current token bucket rate per service and region', 'gauge', ('service', 'region'),
+                  lambda: [((l.service, l.region), l.rate) for l in rate_limiter._limiters.values()])
+metrics.collected('aws_rate_limit_concurrency', 'Current AIMD in-flight window per service and region', 'gauge', ('service', 'region'),
+                  lambda: [((l.service, l.region), int(l.concurrency)) for l in rate_limiter._limiters.values()])
+
+
+def get_rate_limiter() -> RateLimiterRegistry:
+    return rate_limiter
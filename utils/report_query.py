@@ -0,0 +1,203 @@
+import base64
+import csv
+import gzip
+import heapq
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from utils.report_store import read_row_index
+
+
+MAX_PAGE_SIZE = 1000
+RESERVED_PARAMS = {'offset', 'limit', 'cursor', 'columns', 'sort', 'filter'}
+FILTER_PATTERN = re.compile(r'^(.+?)(>=|<=|!=|=|>|<|~)(.*)$')
+
+
+class ReportQueryError(ValueError):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class RowFilter:
+    column: int
+    op: str
+    value: str
+    number: float | None
+
+
+def _normalize(name: str) -> str:
+    # "MonthlyCost($)" -> "monthlycost", "Size(GB)" -> "size"
+    return re.sub(r'\(.*?\)|[^a-z0-9]', '', name.lower())
+
+
+def _as_number(value: str) -> float | None:
+    try:
+        return float(value.replace('$', '').strip())
+    except ValueError:
+        return None
+
+
+def resolve_column(name: str, header: list[str]) -> int:
+    if name in header:
+        return header.index(name)
+    wanted = _normalize(name)
+    for i, column in enumerate(header):
+        if _normalize(column) == wanted:
+            return i
+    raise ReportQueryError(f"Unknown column '{name}', available columns: {', '.join(header)}")
+
+
+def query_param_filter(key: str, value: str) -> str:
+    # any other query parameter is a filter; the query string splits on the first '=', so
+    # ?MonthlyCost>=20 arrives as ('MonthlyCost>', '20') and ?MonthlyCost>20 as ('MonthlyCost>20', '')
+    if key.endswith(('>', '<', '!')):
+        return f"{key}={value}"
+    if FILTER_PATTERN.match(key):
+        if value:
+            raise ReportQueryError(f"Invalid filter '{key}={value}', expected e.g. Region=us-east-1 or MonthlyCost>5")
+        return key
+    return f"{key}={value}"
+
+
+def parse_filters(raw_filters: list[str], header: list[str]) -> list[RowFilter]:
+    filters = []
+    for raw in raw_filters:
+        match = FILTER_PATTERN.match(raw)
+        if not match:
+            raise ReportQueryError(f"Invalid filter '{raw}', expected e.g. Region=us-east-1 or MonthlyCost>5")
+        name, op, value = match.groups()
+        filters.append(RowFilter(column=resolve_column(name.strip(), header), op=op, value=value.strip(), number=_as_number(value)))
+    return filters
+
+
+def _matches(row: list[str], filters: list[RowFilter]) -> bool:
+    for f in filters:
+        cell = row[f.column] if f.column < len(row) else ''
+        if f.op == '~':
+            if f.value.lower() not in cell.lower():
+                return False
+            continue
+        number = _as_number(cell) if f.number is not None else None
+        left, right = (number, f.number) if number is not None else (cell, f.value)
+        if f.op == '=' and not left == right:
+            return False
+        if f.op == '!=' and not left != right:
+            return False
+        if f.op == '>' and not left > right:
+            return False
+        if f.op == '>=' and not left >= right:
+            return False
+        if f.op == '<' and not left < right:
+            return False
+        if f.op == '<=' and not left <= right:
+            return False
+    return True
+
+
+def encode_cursor(position: int, next_offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{position}:{next_offset}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    try:
+        position, next_offset = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return int(position), int(next_offset)
+    except Exception:
+        raise ReportQueryError("Invalid cursor")
+
+
+def _parse_line(line: bytes) -> list[str]:
+    # report rows never contain embedded newlines, so every line is exactly one record
+    return next(csv.reader([line.decode()]), [])
+
+
+def _open(path: Path):
+    return gzip.open(path, 'rb') if path.suffix == '.gz' else open(path, 'rb')
+
+
+def _sort_key(column: int):
+    def key(row: list[str]):
+        cell = row[column] if column < len(row) else ''
+        number = _as_number(cell)
+        return (number is None, number if number is not None else 0.0, cell)
+    return key
+
+
+def query_report(path: Path, offset: int = 0, limit: int = 50, cursor: str | None = None, columns: list[str] | None = None,
+                 sort: str | None = None, filters: list[str] | None = None) -> dict:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    with _open(path) as f:
+        header_line = f.readline()
+        header = _parse_line(header_line)
+        data_start = len(header_line)
+        projection = [resolve_column(c, header) for c in columns] if columns else list(range(len(header)))
+        row_filters = parse_filters(filters or [], header)
+        scanned = 0
+
+        if sort:
+            # ordering needs every matching row, but only offset + limit of them are kept in memory
+            descending = sort.startswith('-')
+            key = _sort_key(resolve_column(sort.lstrip('-+'), header))
+            matching = (row for row in map(_parse_line, f) if _matches(row, row_filters))
+            pick = heapq.nlargest if descending else heapq.nsmallest
+            top = pick(offset + limit + 1, matching, key=key)
+            page, has_more = top[offset:offset + limit], len(top) > offset + limit
+            return {
+                'columns': [header[i] for i in projection],
+                'rows': [[row[i] if i < len(row) else '' for i in projection] for row in page],
+                'offset': offset,
+                'limit': limit,
+                'next_offset': offset + len(page) if has_more else None,
+                'next_cursor': None,
+            }
+
+        position, skip = data_start, offset
+        if cursor:
+            position, offset = decode_cursor(cursor)
+            skip = 0
+        elif offset and not row_filters and path.suffix != '.gz':
+            index = read_row_index(path)
+            if index is not None:
+                stride, offsets = index
+                slot = min(offset // stride, len(offsets) - 1) if offsets else -1
+                if slot >= 0:
+                    position, skip = offsets[slot], offset - slot * stride
+        f.seek(position)
+
+        page = []
+        for line in f:
+            position += len(line)
+            scanned += 1
+            if skip and not row_filters:
+                skip -= 1
+                continue
+            row = _parse_line(line)
+            if not _matches(row, row_filters):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            page.append([row[i] if i < len(row) else '' for i in projection])
+            if len(page) == limit:
+                break
+        has_more = False
+        if len(page) == limit:
+            if not row_filters:
+                has_more = f.peek(1) != b''
+            else:
+                # more lines don't mean more matches, look ahead for one; the cursor still points after the page
+                for line in f:
+                    scanned += 1
+                    if _matches(_parse_line(line), row_filters):
+                        has_more = True
+                        break
+        return {
+            'columns': [header[i] for i in projection],
+            'rows': page,
+            'offset': offset,
+            'limit': limit,
+            'next_offset': offset + len(page) if has_more else None,
+            'next_cursor': encode_cursor(position, offset + len(page)) if has_more else None,
+            'scanned': scanned,
+        }
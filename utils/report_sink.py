@@ -0,0 +1,127 @@
+import aiofiles
+import aiofiles.os
+import asyncio
+import csv
+import os
+import uuid
+import zlib
+from array import array
+from pathlib import Path
+from logger import logger
+from utils.account_scope import scoped_dir
+from utils.report_store import REPORTS_DIR, ROW_INDEX_STRIDE, parse_cost, record_report, write_row_index
+
+
+REPORT_BUFFER_SIZE = int(os.getenv('REPORT_BUFFER_SIZE', 64 * 1024))  # bytes buffered before each write
+REPORTS_GZIP = os.getenv('REPORTS_GZIP', 'false').lower() in ('1', 'true', 'yes')
+
+
+def report_path(name: str, compress: bool = REPORTS_GZIP) -> Path:
+    return scoped_dir(REPORTS_DIR) / (f"{name}.gz" if compress else name)
+
+
+class _RowBuffer:
+    # csv.writer target that keeps encoded chunks, so the byte offset of every row is known
+    def __init__(self):
+        self.parts: list[bytes] = []
+        self.size = 0
+
+    def write(self, text: str) -> int:
+        data = text.encode()
+        self.parts.append(data)
+        self.size += len(data)
+        return len(text)
+
+    def drain(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts.clear()
+        self.size = 0
+        return data
+
+
+class ReportSink:
+    # Rows are streamed into a hidden temp file next to the target and the file is
+    # renamed into place only when the sink closes cleanly, so readers never see a partial report.
+    def __init__(self, path: str | Path, fieldnames: list[str] | None = None, compress: bool | None = None,
+                 checker: str | None = None, region: str | None = None, cost_field: str | None = None, history: bool = True):
+        self.path = Path(path)
+        self.checker = checker  # set to record the finished report in the manifest
+        self.region = region
+        self.cost_field = cost_field
+        self.total_cost = 0.0
+        # (resource id, monthly cost) of every row, the first column identifies the resource
+        self._findings: list[tuple[str, float]] | None = [] if checker and history else None
+        self.compress = self.path.suffix == '.gz' if compress is None else compress
+        if self.compress and self.path.suffix != '.gz':
+            self.path = self.path.with_name(self.path.name + '.gz')
+        self.fieldnames = list(fieldnames) if fieldnames else None
+        self.rows = 0
+        self.bytes_written = 0
+        self._raw_bytes = 0  # uncompressed bytes already flushed
+        self._row_offsets = array('q')  # byte offset of every ROW_INDEX_STRIDE-th row
+        self._tmp_path = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex}.tmp")
+        self._file = None
+        self._buffer = _RowBuffer()
+        self._writer = None
+        self._compressor = zlib.compressobj(wbits=31) if self.compress else None  # wbits=31 -> gzip container
+
+    async def __aenter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = await aiofiles.open(self._tmp_path, mode='wb')
+        if self.fieldnames:
+            self._start(self.fieldnames)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                await self._flush(final=True)
+        finally:
+            await self._file.close()
+        if exc_type is not None:
+            await aiofiles.os.remove(self._tmp_path)
+            logger.error(f"ReportSink Method: ❌ Discarded partial report {self.path}: {exc}")
+            return False
+        if not self.compress:
+            # gzip streams can't be seeked, so only plain CSVs get a row index
+            await asyncio.to_thread(write_row_index, self.path, self._row_offsets, self._raw_bytes)
+        await aiofiles.os.replace(self._tmp_path, self.path)
+        logger.info(f"ReportSink Method: ✅ {self.rows} rows saved to {self.path}")
+        if self.checker:
+            await record_report(self.path, checker=self.checker, region=self.region, rows=self.rows,
+                                total_monthly_cost=self.total_cost, schema=self.fieldnames or [], findings=self._findings)
+        return False
+
+    def _start(self, fieldnames: list[str]) -> None:
+        self.fieldnames = fieldnames
+        self._writer = csv.DictWriter(self._buffer, fieldnames=fieldnames, restval='', lineterminator='\n')
+        self._writer.writeheader()
+
+    async def write(self, row: dict) -> None:
+        if self._writer is None:
+            self._start(list(row.keys()))  # Use keys from the first row as headers
+        if self.rows % ROW_INDEX_STRIDE == 0:
+            self._row_offsets.append(self._raw_bytes + self._buffer.size)
+        self._writer.writerow(row)
+        self.rows += 1
+        cost = parse_cost(row.get(self.cost_field)) if self.cost_field else 0.0
+        self.total_cost += cost
+        if self._findings is not None:
+            self._findings.append((str(row.get(self.fieldnames[0], '')), cost))
+        if self._buffer.size >= REPORT_BUFFER_SIZE:
+            await self._flush()
+
+    async def write_many(self, rows: list[dict]) -> None:
+        for row in rows:
+            await self.write(row)
+
+    async def _flush(self, final: bool = False) -> None:
+        data = self._buffer.drain()
+        self._raw_bytes += len(data)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+            if final:
+                data += self._compressor.flush()
+        if data:
+            await self._file.write(data)
+            self.bytes_written += len(data)
@@ -0,0 +1,151 @@
+import asyncio
+import datetime
+import fcntl
+import functools
+import importlib.util
+import json
+import os
+import tempfile
+from array import array
+from pathlib import Path
+from logger import logger
+from utils.history import findings_history
+
+
+REPORTS_DIR = Path(os.getenv('REPORTS_DIR', 'reports'))
+MANIFEST_NAME = 'manifest.json'
+REPORTS_PARQUET = os.getenv('REPORTS_PARQUET', 'true').lower() in ('1', 'true', 'yes')
+ROW_INDEX_STRIDE = int(os.getenv('ROW_INDEX_STRIDE', 1000))  # rows between two entries of the offset index
+
+_manifest_lock = asyncio.Lock()
+
+
+def parse_cost(value) -> float:
+    # report cells look like "$3.6" or "8.352$"
+    try:
+        return float(str(value).replace('$', '').strip() or 0)
+    except ValueError:
+        return 0.0
+
+
+def _read_manifest(reports_dir: Path) -> dict:
+    path = reports_dir / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(reports_dir: Path, manifest: dict) -> None:
+    path = reports_dir / MANIFEST_NAME
+    # a temp file of its own per writer, a shared name is renamed away under a concurrent writer
+    fd, tmp_path = tempfile.mkstemp(dir=reports_dir, prefix=f".{MANIFEST_NAME}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _update_manifest(reports_dir: Path, name: str, entry: dict) -> None:
+    # account scan workers are separate processes writing the same manifest, the asyncio lock
+    # only covers this one: the read-modify-write holds an exclusive flock on a sidecar file
+    reports_dir.mkdir(parents=True, exist_ok=True)
+    with open(reports_dir / f".{MANIFEST_NAME}.lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # released when the file is closed
+        manifest = _read_manifest(reports_dir)
+        manifest[name] = entry
+        _write_manifest(reports_dir, manifest)
+
+
+def row_index_path(csv_path: Path) -> Path:
+    return csv_path.with_name(f".{csv_path.name}.idx")
+
+
+def write_row_index(csv_path: Path, offsets: array, file_size: int) -> None:
+    # layout: [stride, csv size in bytes, offset of row 0, offset of row stride, ...]
+    path = row_index_path(csv_path)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        array('q', [ROW_INDEX_STRIDE, file_size]).tofile(f)
+        offsets.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def read_row_index(csv_path: Path) -> tuple[int, array] | None:
+    path = row_index_path(csv_path)
+    try:
+        with open(path, 'rb') as f:
+            data = array('q', f.read())
+    except FileNotFoundError:
+        return None
+    # an index left over from another version of the report is useless
+    if len(data) < 2 or data[1] != csv_path.stat().st_size:
+        return None
+    return data[0], data[2:]
+
+
+def _parquet_path(csv_path: Path) -> Path:
+    return csv_path.with_name(csv_path.name.removesuffix('.gz').removesuffix('.csv') + '.parquet')
+
+
+@functools.lru_cache(maxsize=1)
+def parquet_available() -> bool:
+    # columnar copies are optional, CSV remains the source of truth; pyarrow itself is imported by the first write
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def _write_parquet(csv_path: Path) -> Path:
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    parquet_path = _parquet_path(csv_path)
+    tmp_path = parquet_path.with_name(f".{parquet_path.name}.tmp")
+    reader = pa_csv.open_csv(csv_path)  # streams record batches, never the whole file in memory
+    with pq.ParquetWriter(tmp_path, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+    os.replace(tmp_path, parquet_path)
+    return parquet_path
+
+
+async def read_manifest(reports_dir: Path = REPORTS_DIR) -> dict:
+    try:
+        return await asyncio.to_thread(_read_manifest, reports_dir)
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in report_store.read_manifest() Method: {err}")
+        raise
+
+
+async def record_report(path: Path, checker: str, region: str, rows: int, total_monthly_cost: float, schema: list[str],
+                        findings: list[tuple[str, float]] | None = None) -> dict:
+    try:
+        entry = {
+            'checker': checker,
+            'region': region,
+            'rows': rows,
+            'total_monthly_cost': round(total_monthly_cost, 4),
+            'generated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'schema': schema,
+            'parquet': None,
+        }
+        if REPORTS_PARQUET and rows and parquet_available():
+            try:
+                entry['parquet'] = (await asyncio.to_thread(_write_parquet, path)).name
+            except Exception as err:
+                # the CSV is already committed, a failed columnar copy must not lose its manifest entry
+                logger.warning(f"report_store.record_report() Method: ⚠️ No Parquet copy of {path.name}: {err}")
+        if entry['parquet'] is None:
+            _parquet_path(path).unlink(missing_ok=True)  # never leave a copy of an older scan behind
+        async with _manifest_lock:
+            await asyncio.to_thread(_update_manifest, path.parent, path.name, entry)
+        logger.info(f"report_store.record_report() Method: ✅ Manifest updated for {path.name}")
+        if findings is not None:
+            # the CSV is replaced by the next scan, the history keeps its findings and totals
+            await findings_history.record_scan(checker, region, path.name, findings, total_monthly_cost)
+        return entry
+    except Exception as err:
+        logger.error(f"❌ Unexpected error in report_store.record_report() Method: {err}")
+        raise
@@ -0,0 +1,69 @@
+import json
+import os
+import time
+from typing import AsyncIterator
+from fastapi.responses import StreamingResponse
+from logger import logger
+from utils.jobs import current_job
+
+
+STREAM_PROGRESS_INTERVAL = float(os.getenv('STREAM_PROGRESS_INTERVAL', 1.0))  # seconds between two progress events
+STREAM_FORMATS = {
+    'sse': 'text/event-stream',  # EventSource in the dashboard
+    'ndjson': 'application/x-ndjson',  # one {"event": ..., "data": ...} object per line, for scripts
+}
+
+# what the checkers' scan_* generators yield: ('finding', row), ('progress', counts) and a last ('done', summary)
+ScanEvents = AsyncIterator[tuple[str, dict]]
+
+
+class Progress:
+    def __init__(self, total: int | None = None, interval: float = STREAM_PROGRESS_INTERVAL):
+        self.total = total  # None when the resources are paged in and the count is unknown up front
+        self.processed = 0
+        self.interval = interval
+        self._emitted_at = time.monotonic()
+
+    def advance(self, resources: int = 1) -> tuple[str, dict] | None:
+        # a progress event once per interval, however many resources went by in it
+        self.processed += resources
+        now = time.monotonic()
+        if now - self._emitted_at < self.interval:
+            return None
+        self._emitted_at = now
+        return 'progress', {'processed': self.processed, 'total': self.total}
+
+
+async def drain(events: ScanEvents) -> dict:
+    # runs a scan to the end and returns its 'done' summary; inside a job the events go to the job's
+    # stream subscribers, see Job.subscribe
+    job = current_job.get()
+    summary = {}
+    async for event, data in events:
+        if job is not None:
+            job.publish(event, data)
+        if event == 'done':
+            summary = data
+    return summary
+
+
+def format_event(event: str, data: dict, fmt: str) -> str:
+    payload = json.dumps(data, default=str)
+    if fmt == 'sse':
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f'{{"event": "{event}", "data": {payload}}}\n'
+
+
+def stream_response(events: ScanEvents, fmt: str) -> StreamingResponse:
+    async def body():
+        try:
+            async for event, data in events:
+                yield format_event(event, data, fmt)
+        except Exception as err:
+            # the status line is long gone, the error travels as the last event
+            logger.error(f"Error in streaming.stream_response() Method: ❌ {err}")
+            yield format_event('error', {'Error': str(err)}, fmt)
+
+    # no-transform / X-Accel-Buffering keep proxies from holding events back until the scan ends
+    return StreamingResponse(body(), media_type=STREAM_FORMATS[fmt],
+                             headers={'Cache-Control': 'no-cache, no-transform', 'X-Accel-Buffering': 'no'})
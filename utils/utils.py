@@ -1,33 +1,14 @@
-import csv
-import aiofiles
 import json
-import boto3
-import datetime
-import pandas as pd
-from io import StringIO
 from logger import logger
+from utils.report_sink import ReportSink, REPORTS_DIR
+from utils.report_store import read_manifest
+from utils.jobs import count_api_call
+from utils.instrumentation import record_response_bytes
 from botocore.exceptions import ClientError
-from botocore.config import Config
-from mypy_boto3_ec2.client import EC2Client
 from pathlib import Path
-
-
-REGION_NAME_MAP = {
-    "us-east-1": "US East (N. Virginia)",
-    "us-east-2": "US East (Ohio)",
-    "us-west-1": "US West (N. California)",
-    "us-west-2": "US West (Oregon)",
-    "ap-south-1": "Asia Pacific (Mumbai)",
-    "ap-northeast-1": "Asia Pacific (Tokyo)",
-    "eu-central-1": "EU (Frankfurt)",
-    "eu-west-1": "EU (Ireland)",
-    # Add more if needed
-}
-
-
-REPORTS_DIR = Path('reports')
-
-
+from functools import lru_cache
+from utils.regions import REGION_NAME_MAP
+from utils.offline_pricing import AmbiguousPriceError
 
 
 async def get_report_summary():
@@ -35,62 +16,64 @@ async def get_report_summary():
         summary = {
             "ec2": 0,
             "eip": 0,
-            "ebs": 0
+            "ebs": 0,
+            "snapshot": 0
         }
-        if (REPORTS_DIR / "idle_ec2_report.csv").exists():
-            df = pd.read_csv(REPORTS_DIR / "idle_ec2_report.csv")
-            summary['ec2'] = len(df)
-        if (REPORTS_DIR / "eip_report.csv").exists():
-            df = pd.read_csv(REPORTS_DIR / "eip_report.csv")
-            summary['eip'] = len(df)
-        if (REPORTS_DIR / "unused_ebs.csv").exists():
-            df = pd.read_csv(REPORTS_DIR / "unused_ebs.csv")
-            summary['ebs'] = len(df)
+        costs = {checker: 0.0 for checker in summary}
+        # The manifest is updated whenever a report is written, so the summary never parses a report
+        for entry in (await read_manifest()).values():
+            checker = entry.get('checker')
+            if checker in summary:
+                summary[checker] += entry['rows']
+                costs[checker] += entry['total_monthly_cost']
+        summary['costs'] = {checker: round(cost, 2) for checker, cost in costs.items()}
         return summary
     except Exception as err:
         logger.error(f"❌ Unexpected error in get_report_summary() Method: {err}")
         raise
 
 
-async def get_instance_state(ec2: EC2Client) -> list[dict]:
-    try:
-        paginator = ec2.get_paginator('describe_instances')
-        result = []
-        async for page in paginator.paginate():
-            for reserv in page['Reservations']:
-                for instance in reserv['Instances']:
-                    result.append({
-                        'id': instance['InstanceId'],
-                        'state': instance['State']['Name'],
-                        'type': instance['InstanceType'],
-                        'region': ec2.meta.region_name
-                    })
-        return result
-    except ClientError as err:
-        print(f"❌ AWS ClientError: {err}")
-        raise 
+PRICE_LIST_CANDIDATES = 10  # products inspected per get_products call
 
-    except Exception as err:
-        print(f"❌ Unexpected error: {err}")
-        raise 
 
+@lru_cache(maxsize=1)
+def get_pricing_client():
+    # boto3 clients are thread-safe, so one client is shared by every pricing lookup;
+    # PriceCache calls it through the rate limiter, which does the retrying
+    import boto3  # only scans need it, see ClientPool._session
+    from botocore.config import Config
+    client = boto3.client('pricing', region_name='us-east-1', config=Config(retries={'mode': 'standard', 'total_max_attempts': 1}))
+    client.meta.events.register('before-parameter-build', count_api_call)
+    client.meta.events.register('after-call', record_response_bytes)
+    return client
 
 
 def get_aws_resource_price(service_code: str, filters: list, region: str) -> float:
     try:
-        client = boto3.client('pricing', region_name='us-east-1', config=Config(retries={'max_attempts': 10, 'mode': 'standard'}))
+        client = get_pricing_client()
         location = REGION_NAME_MAP.get(region, region)
         pricing_filters = [{'Type': 'TERM_MATCH', 'Field': 'location', 'Value': location}]
         for f in filters:
             pricing_filters.append({'Type': 'TERM_MATCH', 'Field': f['Field'], 'Value': f['Value']})
-        resp = client.get_products(ServiceCode=service_code, Filters=pricing_filters, MaxResults=1)
+        resp = client.get_products(ServiceCode=service_code, Filters=pricing_filters, MaxResults=PRICE_LIST_CANDIDATES)
         if not resp['PriceList']:
             logger.info(f"❌ No pricing data found for {service_code} in {region} with filters {filters}")
             raise ValueError(f"No pricing data found for service {service_code} in {region} with filters {filters}")
-        price_item = json.loads(resp['PriceList'][0])
-        terms = price_item['terms']['OnDemand']
-        price_dimensions = next(iter(next(iter(terms.values()))['priceDimensions'].values()))
-        return float(price_dimensions['pricePerUnit']['USD'])
+        # Look at every OnDemand first-tier USD dimension instead of whichever term came back first
+        candidates = set()
+        for raw_item in resp['PriceList']:
+            price_item = json.loads(raw_item)
+            for term in price_item['terms'].get('OnDemand', {}).values():
+                for dimension in term['priceDimensions'].values():
+                    price = float(dimension['pricePerUnit'].get('USD', 0))
+                    if dimension.get('beginRange', '0') == '0' and price > 0:
+                        candidates.add(price)
+        if not candidates:
+            raise ValueError(f"No OnDemand price found for service {service_code} in {region} with filters {filters}")
+        if len(candidates) > 1:
+            # several SKUs at different prices, the filters don't pin down one product (e.g. BYOL vs license included)
+            raise AmbiguousPriceError(f"Ambiguous price for service {service_code} in {region} with filters {filters}: {sorted(candidates)}")
+        return candidates.pop()
     except ClientError as err:
         logger.error(f"Error in utils.get_aws_resource_price() Method: ❌ AWS ClientError: {err}")
         raise
@@ -106,43 +89,6 @@ async def save_to_csv(data: list[dict], fil_path: str):
         logger.info("utils.save_to_csv() Method: No data to save.")
         return
     path = Path(fil_path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    buffer = StringIO() # In-memory text stream
-    writer = csv.DictWriter(buffer, fieldnames=data[0].keys()) # Use keys from the first dict as headers
-    writer.writeheader()
-    writer.writerows(data)
-    async with aiofiles.open(path, mode='w') as f:
-        await f.write(buffer.getvalue())
+    async with ReportSink(path) as sink:
+        await sink.write_many(data)
     logger.info(f"utils.save_to_csv() Method: ✅ Async report saved to {path}")
-
-
-
-
-
-async def gat_daily_cost(region: str):
-    try:
-        client = boto3.client('ce', region_name='us-east-1')
-        end_date = datetime.datetime.utcnow().date()
-        start_date = end_date - datetime.timedelta(days=7)
-        response = client.get_cost_and_usage(
-            TimePeriod={
-                "start": start_date.strftime('%Y-%m-%d'),
-                "end": end_date.strftime('%Y-%m-%d')
-            },
-            Granularity='DAILY',
-            Metrics=['UnblendedCost'],
-        )
-        data = [
-            {
-                "date": item['TimePeriod']['Start'],
-                "amount": float(item['Total']['UnblendedCost']['Amount']),
-                "region": region,
-                "currency": item['Total']['UnblendedCost']['Unit']
-            }
-            for item in response['ResultsByTime']
-        ]
-        logger.info(f"utils.gat_daily_cost() Method: ✅ Daily cost data fetched for region {region}")
-        return data
-    except Exception as err:
-        logger.error(f"❌ Unexpected error in gat_daily_cost() Method: {err}")
-        raise
\ No newline at end of file